@@ -6,56 +6,80 @@ Progressive questioning system for AI PC builds
 
 import discord
 from discord.ext import commands, tasks
+import io
 import json
 import os
 import re
+import sys
 import asyncio
-from datetime import datetime, timedelta
+from dataclasses import dataclass, field
+from datetime import datetime
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 from typing import Dict, List, Optional, Tuple
-import threading
 import time
 import logging
+from collections import OrderedDict, deque
+from itertools import islice
+from functools import lru_cache, partial
+from concurrent.futures import ThreadPoolExecutor
 import atexit
+import hashlib
+import sqlite3
+import threading
 
 # File locking for concurrency safety
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 class FileLock:
-    """Simple file-based locking mechanism"""
+    """Advisory file lock held on a persistent descriptor (flock/msvcrt)"""
+    _instances = []
+    
     def __init__(self, lock_file):
         self.lock_file = lock_file
-        self.lock = threading.Lock()
+        self.fd = os.open(self.lock_file, os.O_CREAT | os.O_RDWR, 0o644)
+        FileLock._instances.append(self)
     
-    def acquire(self, timeout=5):
-        """Acquire lock with timeout"""
-        start_time = time.time()
-        while time.time() - start_time < timeout:
-            try:
-                # Try to create lock file exclusively
-                with open(self.lock_file, 'x') as f:
-                    f.write(str(os.getpid()))
-                return True
-            except FileExistsError:
-                # Lock file exists, wait and retry
-                time.sleep(0.1)
-            except Exception:
-                return False
-        return False
+    def acquire(self):
+        """Attempt a single non-blocking exclusive lock; False if another process holds it"""
+        try:
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except BlockingIOError:
+            return False
+        except OSError:
+            # msvcrt reports contention as EACCES/EDEADLOCK
+            if fcntl:
+                raise
+            return False
     
     def release(self):
-        """Release lock"""
+        """Release lock (the lock file itself is kept for reuse)"""
         try:
-            if os.path.exists(self.lock_file):
-                os.remove(self.lock_file)
+            if fcntl:
+                fcntl.flock(self.fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self.fd, 0, os.SEEK_SET)
+                msvcrt.locking(self.fd, msvcrt.LK_UNLCK, 1)
         except Exception:
             pass
     
-    def __enter__(self):
-        if not self.acquire():
-            raise Exception(f"Could not acquire lock for {self.lock_file}")
-        return self
-    
-    def __exit__(self, exc_type, exc_val, exc_tb):
-        self.release()
+    def close(self):
+        """Close the underlying descriptor"""
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+            self.fd = None
 
 # Configuration
 API_KEY = os.environ.get('GEMINI_API_KEY', 'YOUR_GEMINI_API_KEY_HERE')
@@ -68,51 +92,105 @@ INSTANCE_ID = f"{os.getpid()}_{int(time.time())}"
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 PARTS_DATA_FILE = os.path.join(SCRIPT_DIR, "latest_parts_formatted")
 IMAGE_CACHE_FILE = os.path.join(SCRIPT_DIR, "image_cache.json")
-USER_SESSIONS_FILE = os.path.join(SCRIPT_DIR, "discord_sessions.json")
+USER_SESSIONS_FILE = os.path.join(SCRIPT_DIR, "discord_sessions.json")  # periodic snapshot
+USER_SESSIONS_LOG = os.path.join(SCRIPT_DIR, "discord_sessions.jsonl")  # changes since the snapshot
+PROMPT_CACHE_FILE = os.path.join(SCRIPT_DIR, "prompt_cache.db")
+
+# Whether the parts data file exists - checked once in on_ready, then kept current by load_parts_data
+parts_data_available: Optional[bool] = None
+
+# Messages kept per session (everything past this is never sent to Gemini)
+CHAT_HISTORY_LIMIT = 30
+
+# Most sessions kept in memory; the least recently active are dropped beyond this
+MAX_SESSIONS = 10000
+
+# Pretty-print session files for debugging (compact JSON otherwise)
+SESSIONS_PRETTY_JSON = os.environ.get('SESSIONS_PRETTY_JSON', '').lower() in ('1', 'true', 'yes')
+
+# Maximum number of Gemini requests in flight at once (avoids rate-limit storms)
+GEMINI_CONCURRENCY = 8
+
+# In-memory cache of compression/summary responses (entries)
+RESPONSE_CACHE_SIZE = 2000
 
-# Lock file paths for concurrency safety
-COLLECTIVE_LOCK_FILE = os.path.join(SCRIPT_DIR, '.collective_lock')
-SESSIONS_LOCK_FILE = os.path.join(SCRIPT_DIR, '.sessions_lock')
+# Opt-in: collective-file compression prompts from different users share one Gemini request
+# (their conversations end up in one model context). Per-user session summaries are never batched.
+GEMINI_BATCHING = os.environ.get('GEMINI_BATCHING', '').lower() in ('1', 'true', 'yes')
+
+# Compression prompts queued within this window (seconds) share one Gemini request
+GEMINI_BATCH_WINDOW = 0.2
+GEMINI_BATCH_SIZE = 8
+# Extra seconds of request timeout per task beyond the first in a batched request
+GEMINI_BATCH_TIMEOUT_PER_TASK = 1
+
+# Held for the process lifetime so only one instance owns the data files
+INSTANCE_LOCK_FILE = os.environ.get('BOT_LOCK_FILE', os.path.join(SCRIPT_DIR, '.bot.lock'))
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Cleanup function to remove lock files on exit
+def acquire_instance_lock() -> bool:
+    """Take the single-instance lock; False only if another instance already holds it"""
+    try:
+        return FileLock(INSTANCE_LOCK_FILE).acquire()
+    except OSError as e:
+        # e.g. a read-only app directory - run unlocked rather than not at all
+        logger.warning(f"Could not lock {INSTANCE_LOCK_FILE}, running without the instance lock: {e}")
+        return True
+
+# Cleanup function to release lock descriptors on exit
 def cleanup_lock_files():
-    """Remove lock files when bot shuts down"""
+    """Close lock file descriptors when bot shuts down"""
     try:
-        if os.path.exists(COLLECTIVE_LOCK_FILE):
-            os.remove(COLLECTIVE_LOCK_FILE)
-        if os.path.exists(SESSIONS_LOCK_FILE):
-            os.remove(SESSIONS_LOCK_FILE)
-        logger.info("Lock files cleaned up on exit")
+        for lock in FileLock._instances:
+            lock.release()
+            lock.close()
+        logger.info("Lock files released on exit")
     except Exception as e:
         logger.error(f"Error cleaning up lock files: {e}")
 
 # Register cleanup function
 atexit.register(cleanup_lock_files)
 
+@dataclass(slots=True)
+class ParsedBuild:
+    """The pieces of a generated build that the UI and save paths read"""
+    
+    name: str = "Custom PC Build"
+    description_lines: List[str] = field(default_factory=list)  # text before COMPONENT BREAKDOWN
+    component_lines: List[str] = field(default_factory=list)  # COMPONENT BREAKDOWN section
+    parts: List[str] = field(default_factory=list)  # first ENTRY_MAX_PARTS short "label: value" lines
+    part_names: List[str] = field(default_factory=list)  # bare names of the core components
+    total_price: Optional[str] = None  # from the DEBUG PRICE CHECK total
+
+@dataclass(slots=True)
 class PCBuilderSession:
     """Manages a user's PC building session"""
     
-    def __init__(self, user_id: int):
-        self.user_id = user_id
-        self.chat_history = []
-        self.answers = {}
-        self.build_result = ""
-        self.refinement_mode = False
-        self.conversation_mode = False
-        self.feedback_mode = False
-        self.user_feedback = ""
-        self.build_edits = []  # Track what user says when editing builds
-        self.created_at = datetime.now().isoformat()
-        self.last_activity = datetime.now().isoformat()
-        
+    user_id: int
+    chat_history: deque = field(default_factory=lambda: deque(maxlen=CHAT_HISTORY_LIMIT))
+    answers: dict = field(default_factory=dict)
+    build_result: str = ""
+    refinement_mode: bool = False
+    conversation_mode: bool = False
+    feedback_mode: bool = False
+    user_feedback: str = ""
+    build_edits: list = field(default_factory=list)  # Track what user says when editing builds
+    created_at: Optional[str] = field(default_factory=lambda: datetime.now().isoformat())
+    last_activity: float = field(default_factory=time.time)  # epoch seconds
+    # Runtime-only state, not persisted
+    _history_version: int = field(default=0, init=False, repr=False)  # bumped by add_message
+    _history_cache: Optional[Tuple[int, int, str]] = field(default=None, init=False, repr=False)
+    _chat_text_cache: Optional[Tuple[int, int, str]] = field(default=None, init=False, repr=False)
+    _parsed_build: Optional[Tuple[str, ParsedBuild]] = field(default=None, init=False, repr=False)
+    _keyword_hits: Optional[Tuple[str, frozenset]] = field(default=None, init=False, repr=False)
+    
     def to_dict(self):
         return {
             'user_id': self.user_id,
-            'chat_history': self.chat_history,
+            'chat_history': list(self.chat_history),
             'answers': self.answers,
             'build_result': self.build_result,
             'refinement_mode': self.refinement_mode,
@@ -127,8 +205,12 @@ class PCBuilderSession:
     @classmethod
     def from_dict(cls, data):
         session = cls(data['user_id'])
-        session.chat_history = data.get('chat_history', [])
-        session.answers = data.get('answers', {})
+        session.chat_history = deque(data.get('chat_history', []), maxlen=CHAT_HISTORY_LIMIT)
+        # Answer values ('black', '5', 'fortnite', ...) repeat across users - share one copy
+        session.answers = {
+            k: sys.intern(v) if isinstance(v, str) else v
+            for k, v in data.get('answers', {}).items()
+        }
         session.build_result = data.get('build_result', '')
         session.refinement_mode = data.get('refinement_mode', False)
         session.conversation_mode = data.get('conversation_mode', False)
@@ -136,133 +218,210 @@ class PCBuilderSession:
         session.user_feedback = data.get('user_feedback', '')
         session.build_edits = data.get('build_edits', [])
         session.created_at = data.get('created_at')
-        session.last_activity = data.get('last_activity')
+        session.last_activity = cls._parse_activity(data.get('last_activity'))
         return session
     
+    @staticmethod
+    def _parse_activity(value) -> float:
+        """Accept epoch floats as well as ISO strings written by older versions"""
+        if isinstance(value, (int, float)):
+            return float(value)
+        try:
+            return datetime.fromisoformat(value).timestamp()
+        except (TypeError, ValueError):
+            return 0.0  # unknown age - expired by the next cleanup
+    
+    def add_message(self, role: str, text: str):
+        """Append a chat message (use this rather than chat_history.append so caches see it)"""
+        self.chat_history.append({'role': role, 'text': text})
+        self._history_version += 1
+    
+    def get_chat_text_lower(self) -> str:
+        """All message text joined and lowercased, rebuilt only when the history has changed"""
+        version, length = self._history_version, len(self.chat_history)
+        cached = self._chat_text_cache
+        if cached and cached[0] == version and cached[1] == length:
+            return cached[2]
+        text = " ".join(msg.get('text', '') for msg in self.chat_history).lower()
+        self._chat_text_cache = (version, length, text)
+        return text
+    
+    def get_keyword_hits(self) -> frozenset:
+        """Keyword tags found in the chat, recomputed only when the chat text changes"""
+        chat_text = self.get_chat_text_lower()
+        cached = self._keyword_hits
+        if cached and cached[0] is chat_text:
+            return cached[1]
+        hits = frozenset(_keyword_hits(chat_text))
+        self._keyword_hits = (chat_text, hits)
+        return hits
+    
+    def get_parsed_build(self) -> ParsedBuild:
+        """build_result parsed once per build; re-parsed whenever a new build is assigned"""
+        cached = self._parsed_build
+        if cached and cached[0] is self.build_result:
+            return cached[1]
+        parsed = parse_build(self.build_result)
+        self._parsed_build = (self.build_result, parsed)
+        return parsed
+    
     def update_activity(self):
-        self.last_activity = datetime.now().isoformat()
+        self.last_activity = time.time()
 
 class SessionManager:
-    """Manages user sessions with file persistence"""
+    """Manages user sessions persisted as a snapshot plus an append-only change log"""
     
     def __init__(self):
-        self.sessions: Dict[int, PCBuilderSession] = {}
+        self.sessions: "OrderedDict[int, PCBuilderSession]" = OrderedDict()  # least recently used first
+        self._dirty = set()  # user_ids with changes not yet appended to the log
+        self._save_lock = asyncio.Lock()
         self.load_sessions()
     
     def load_sessions(self):
-        """Load sessions from file with file locking"""
+        """Load the snapshot and replay the change log (runs once at startup, before the event loop)"""
         try:
-            if os.path.exists(USER_SESSIONS_FILE):
-                with FileLock(SESSIONS_LOCK_FILE):
-                    with open(USER_SESSIONS_FILE, 'r') as f:
-                        data = json.load(f)
-                        for user_id_str, session_data in data.items():
-                            user_id = int(user_id_str)
-                            self.sessions[user_id] = PCBuilderSession.from_dict(session_data)
+            try:
+                with open(USER_SESSIONS_FILE, 'r') as f:
+                    content = f.read()
+                if content.strip():
+                    for user_id_str, session_data in json.loads(content).items():
+                        user_id = int(user_id_str)
+                        self.sessions[user_id] = PCBuilderSession.from_dict(session_data)
+            except FileNotFoundError:
+                pass
+            
+            try:
+                with open(USER_SESSIONS_LOG, 'rb') as f:
+                    for line in f:
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue  # torn final line from an interrupted append
+                        # Later entries win; a null payload records a cleared session
+                        if entry['d'] is None:
+                            self.sessions.pop(entry['u'], None)
+                        else:
+                            self.sessions[entry['u']] = PCBuilderSession.from_dict(entry['d'])
+            except FileNotFoundError:
+                pass
+        
+            # Seed the LRU order from the last activity recorded on disk
+            self.sessions = OrderedDict(sorted(self.sessions.items(), key=lambda item: item[1].last_activity))
+            self._evict_over_limit()
         except Exception as e:
             logger.error(f"Error loading sessions: {e}")
     
-    def save_sessions(self):
-        """Save sessions to file with file locking"""
+    def _evict_over_limit(self):
+        """Drop the least recently used sessions beyond MAX_SESSIONS"""
+        while len(self.sessions) > MAX_SESSIONS:
+            user_id, _ = self.sessions.popitem(last=False)
+            self._dirty.add(user_id)
+    
+    def _collect_dirty(self) -> bytes:
+        """Serialize dirty sessions as log lines and reset the dirty set"""
+        dirty, self._dirty = self._dirty, set()
+        lines = []
+        for user_id in dirty:
+            session = self.sessions.get(user_id)
+            entry = {'u': user_id, 'd': session.to_dict() if session else None, 'ts': time.time()}
+            lines.append(json.dumps(entry, separators=(',', ':')))
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+    
+    def _append_log(self, payload: bytes):
+        """Append serialized changes to the session log (runs in a worker thread)"""
+        with open(USER_SESSIONS_LOG, 'ab', buffering=65536) as f:
+            f.write(payload)
+    
+    def _write_snapshot(self, payload: bytes):
+        """Replace the snapshot and truncate the log (runs in a worker thread)"""
+        tmp_path = f"{USER_SESSIONS_FILE}.tmp"
+        with open(tmp_path, 'wb', buffering=65536) as f:
+            f.write(payload)
+        os.replace(tmp_path, USER_SESSIONS_FILE)
+        with open(USER_SESSIONS_LOG, 'wb'):
+            pass
+    
+    def mark_dirty(self, user_id: int):
+        """Schedule a user's session to be logged on the next flush"""
+        self._dirty.add(user_id)
+    
+    async def save_sessions(self):
+        """Append changed sessions to the log without blocking the event loop"""
+        if not self._dirty:
+            return
         try:
-            data = {}
-            for user_id, session in self.sessions.items():
-                data[str(user_id)] = session.to_dict()
-            with FileLock(SESSIONS_LOCK_FILE):
-             with open(USER_SESSIONS_FILE, 'w') as f:
-                json.dump(data, f, indent=2)
+            # Serialize on the loop thread so sessions can't change mid-dump
+            payload = self._collect_dirty()
+            async with self._save_lock:
+                await asyncio.to_thread(self._append_log, payload)
         except Exception as e:
             logger.error(f"Error saving sessions: {e}")
     
+    async def compact_sessions(self):
+        """Fold the change log into a fresh snapshot of all sessions"""
+        try:
+            async with self._save_lock:
+                # The snapshot covers every pending change, so the log can start empty
+                self._dirty.clear()
+                data = {str(user_id): session.to_dict() for user_id, session in self.sessions.items()}
+                if SESSIONS_PRETTY_JSON:
+                    payload = json.dumps(data, indent=2)
+                else:
+                    payload = json.dumps(data, separators=(',', ':'))
+                await asyncio.to_thread(self._write_snapshot, payload.encode('utf-8'))
+        except Exception as e:
+            logger.error(f"Error compacting sessions: {e}")
+    
+    def flush_on_exit(self):
+        """Synchronously append any pending changes (atexit hook)"""
+        try:
+            if self._dirty:
+                self._append_log(self._collect_dirty())
+        except Exception as e:
+            logger.error(f"Error saving sessions on exit: {e}")
+    
     def get_session(self, user_id: int) -> PCBuilderSession:
         """Get or create a session for a user"""
-        if user_id not in self.sessions:
-            self.sessions[user_id] = PCBuilderSession(user_id)
+        session = self.sessions.get(user_id)
+        if session is None:
+            session = self.sessions[user_id] = PCBuilderSession(user_id)
+            self._dirty.add(user_id)
+            self._evict_over_limit()
+        else:
+            self.sessions.move_to_end(user_id)
         
-        session = self.sessions[user_id]
+        # A bare touch isn't logged; last_activity reaches disk with the next compaction
         session.update_activity()
         return session
     
+    def find_session(self, user_id: int) -> Optional[PCBuilderSession]:
+        """Get a user's existing session without creating one"""
+        session = self.sessions.get(user_id)
+        if session is not None:
+            self.sessions.move_to_end(user_id)
+            session.update_activity()
+        return session
+    
     def clear_session(self, user_id: int):
         """Clear a user's session"""
-        if user_id in self.sessions:
-            del self.sessions[user_id]
-        self.save_sessions()
+        self.sessions.pop(user_id, None)
+        self._dirty.add(user_id)
     
     def cleanup_old_sessions(self, max_age_hours: int = 24):
         """Remove sessions older than max_age_hours"""
-        cutoff = datetime.now() - timedelta(hours=max_age_hours)
-        to_remove = []
-        
-        for user_id, session in self.sessions.items():
-            try:
-                last_activity = datetime.fromisoformat(session.last_activity)
-                if last_activity < cutoff:
-                    to_remove.append(user_id)
-            except:
-                to_remove.append(user_id)
+        cutoff_ts = time.time() - max_age_hours * 3600
+        to_remove = [user_id for user_id, session in self.sessions.items() if session.last_activity < cutoff_ts]
         
         for user_id in to_remove:
             del self.sessions[user_id]
+        self._dirty.update(to_remove)
         
         if to_remove:
-            self.save_sessions()
             logger.info(f"Cleaned up {len(to_remove)} old sessions")
 
-class ConversationalFlow:
-    """Handles open-ended conversational PC building flow"""
-    
-    REQUIRED_FIELDS = ['budget', 'color', 'rgb_level', 'aesthetics', 'use_case', 'upgradeability', 'extra_notes']
-    
-    def __init__(self):
-        self.preloaded_greeting = "Hey! I'm your AI PC builder. What's your budget for this build?"
-    
-    def format_history(self, chat_history):
-        """Format chat history for Gemini prompt"""
-        out = []
-        for m in chat_history[-30:]:  # Last 30 messages
-            role = m.get('role', 'assistant').capitalize()
-            text = (m.get('text') or '').strip()
-            if text:
-                out.append(f"{role}: {text}")
-        return "\n".join(out)
-    
-    def build_conversation_prompt(self, chat_history, answers):
-        """Build the conversational prompt for Gemini"""
-        history_text = self.format_history(chat_history)
-        answers_text = "\n".join([f"- {k}: {answers.get(k)}" for k in self.REQUIRED_FIELDS if answers.get(k)])
-        missing = [k for k in self.REQUIRED_FIELDS if not answers.get(k)]
-        missing_text = ", ".join(missing) if missing else "none"
-        
-        return f"""
-You are the onboarding wizard for an AI PC builder. Friendly, concise, conversational.
-The UI already showed the first assistant message below — do NOT repeat it; continue naturally from it:
-PRELOADED: {self.preloaded_greeting}
-
-Conversation so far:
-{history_text}
-
-Collected answers so far (if any):
-{answers_text or 'none'}
-
-Fields to capture (ONLY these 7 fields - do NOT ask about components):
-- budget (freeform; numbers or ranges like 800-1500 are fine)
-- color (recommend black/white, but accept any choice; suggest RGB can provide exotic colors)
-- rgb_level preference (number 0–10 OR words like "none", "subtle", "medium", "lots", "max")
-- aesthetics preference (number 0–10 OR words like "low", "balanced", "high")
-- use_case (freeform: games, streaming, editing, etc.)
-- upgradeability (freeform: "won't upgrade", "might upgrade", "will upgrade")
-- extra_notes (freeform: any special requirements, or "none")
-
-Missing fields: {missing_text}
-
-CRITICAL: Do NOT ask about AMD vs Intel, NVIDIA vs AMD, cooling types, or any specific components. Only ask about the 7 fields above.
-
-
-
-PERFORMANCE TIERLIST (reference only):
-Use this to judge relative GPU performance when selecting parts.
-RTX 5090 32GB............... 100
+# Prompt templates - static text is built once at import; only the small per-call
+# sections are interpolated on each request
+_TIERLIST = """RTX 5090 32GB............... 100
 RTX Pro 6000 Blackwell 96GB.  90
 RX 7900 XTX 24GB............  75
 RTX 5080 16GB...............  74
@@ -286,7 +445,33 @@ RX 7600 8GB.................  38
 RTX 3060 12GB...............  35
 RTX 5050 8GB................  34
 RTX 3050 6GB................  28
-(If a model is not listed, approximate using adjacent models and VRAM class.)
+"""
+
+_CONVERSATION_PROMPT_HEAD = """
+You are the onboarding wizard for an AI PC builder. Friendly, concise, conversational.
+The UI already showed the first assistant message below — do NOT repeat it; continue naturally from it:
+PRELOADED: """
+
+_CONVERSATION_PROMPT_FIELDS = """Fields to capture (ONLY these 7 fields - do NOT ask about components):
+- budget (freeform; numbers or ranges like 800-1500 are fine)
+- color (recommend black/white, but accept any choice; suggest RGB can provide exotic colors)
+- rgb_level preference (number 0–10 OR words like "none", "subtle", "medium", "lots", "max")
+- aesthetics preference (number 0–10 OR words like "low", "balanced", "high")
+- use_case (freeform: games, streaming, editing, etc.)
+- upgradeability (freeform: "won't upgrade", "might upgrade", "will upgrade")
+- extra_notes (freeform: any special requirements, or "none")
+
+"""
+
+_CONVERSATION_PROMPT_TAIL = """
+
+CRITICAL: Do NOT ask about AMD vs Intel, NVIDIA vs AMD, cooling types, or any specific components. Only ask about the 7 fields above.
+
+
+
+PERFORMANCE TIERLIST (reference only):
+Use this to judge relative GPU performance when selecting parts.
+""" + _TIERLIST + """(If a model is not listed, approximate using adjacent models and VRAM class.)
 
 - RGB levels: 0-3 (minimal), 4-6 (moderate), 7-10 (lots)
 - Aesthetics: 0-3 (performance first), 4-6 (balanced), 7-10 (looks matter)
@@ -313,81 +498,17 @@ Instructions:
 
 IMPORTANT: You MUST end your message with <READY_TO_BUILD> when you have collected information for ALL 7 fields: budget, color, rgb_level, aesthetics, use_case, upgradeability, and extra_notes.
 """
-    
 
-class PCBuildGenerator:
-    """Handles PC build generation and refinement using Gemini"""
-    
-    def __init__(self):
-        genai.configure(api_key=API_KEY)
-        self.model = genai.GenerativeModel("gemini-1.5-pro-latest")
-    
-    def load_parts_data(self) -> str:
-        """Load the latest parts data"""
-        try:
-            if os.path.exists(PARTS_DATA_FILE):
-                with open(PARTS_DATA_FILE, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if not content.strip():
-                        logger.warning(f"Parts data file is empty: {PARTS_DATA_FILE}")
-                        return ""
-                    return content
-            else:
-                logger.error(f"Parts data file not found: {PARTS_DATA_FILE}")
-                logger.error("Please ensure the parts data file exists in the same directory as the bot")
-                return ""
-        except Exception as e:
-            logger.error(f"Error loading parts data: {e}")
-            return ""
-    
-    def load_image_cache(self) -> Dict[str, str]:
-        """Load image cache"""
-        try:
-            if os.path.exists(IMAGE_CACHE_FILE):
-                with open(IMAGE_CACHE_FILE, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    return data.get('images', {})
-            return {}
-        except Exception as e:
-            logger.error(f"Error loading image cache: {e}")
-            return {}
-    
-    def build_prompt(self, session: PCBuilderSession, parts_data: str) -> str:
-        """Build the Gemini prompt"""
-        
-        # Extract budget value for calculations - handle open-ended inputs
-        budget_text = session.answers.get('budget', '$1000')
-        budget_match = re.search(r'(\d+[\,\d]*)', budget_text.replace(',', ''))
-        
-        if budget_match:
-            budget_val = int(budget_match.group(1).replace(',', ''))
-            # Calculate adjusted budget (85% or -$200, whichever is less)
-            reduced = int(budget_val * 0.85)
-            adjusted_budget = min(reduced, budget_val - 200)
-            if budget_val - adjusted_budget < 200:
-                adjusted_budget = budget_val - 200
-            price_range = f"MAXIMUM TOTAL BUDGET: ${adjusted_budget} (absolute maximum, do not exceed)"
-        else:
-            # Handle open-ended budget requests
-            budget_lower = budget_text.lower()
-            if any(word in budget_lower for word in ['fortnite', 'gaming', 'game']):
-                # Default gaming budget if they asked about gaming
-                adjusted_budget = 800
-                price_range = f"RECOMMENDED GAMING BUDGET: ${adjusted_budget} (good for competitive gaming like Fortnite)"
-            elif any(word in budget_lower for word in ['budget', 'cost', 'price', 'spend', 'afford']):
-                # Default mid-range budget for general advice
-                adjusted_budget = 1200
-                price_range = f"RECOMMENDED BUDGET: ${adjusted_budget} (balanced performance and value)"
-            else:
-                # Default budget
-                adjusted_budget = 1000
-                price_range = f"RECOMMENDED BUDGET: ${adjusted_budget} (good starting point)"
-        
-        prompt = f"""
-You are a friendly PC build expert. Using the compact catalog below and the user's brief, design a cohesive, great-looking build that balances performance, noise, thermals, and value. Be creative and lean into the user's style, but keep things practical and compatible.
+# First number in the budget answer, after thousands separators are stripped
+_BUDGET_RE = re.compile(r'\d+')
+
+_BUILD_PROMPT_HEAD = """
+You are a friendly PC build expert. Using the compact catalog below and the user's brief (under BUDGET AND CONTEXT at the end), design a cohesive, great-looking build that balances performance, noise, thermals, and value. Be creative and lean into the user's style, but keep things practical and compatible.
 
 CATALOG (compact, one line per item):
-{parts_data}
+"""
+
+_BUILD_PROMPT_TAIL = """
 
 How to read the catalog:
 - Only lines that start with "I|" are items.
@@ -398,18 +519,9 @@ How to read the catalog:
 - Treat these catalog prices as the ONLY valid prices; do not estimate or infer prices from anywhere else.
 
 COST RULES (hard constraints):
-- Absolute budget cap: ${adjusted_budget if adjusted_budget else 'use max in context'}.
+- Absolute budget cap: as given under BUDGET AND CONTEXT.
 - Choose variants using the catalog prices to stay within budget; if needed, step down to cheaper options (including iGPU builds) while keeping compatibility and color.
 
-BUDGET AND CONTEXT:
-- Max total budget: {price_range}
-- Use case: {session.answers.get('use_case', 'General use')}
-- Color scheme: {session.answers.get('color', 'Black')}
-- RGB preference (0-10): {session.answers.get('rgb_level', '5')}
-- Aesthetics priority (0-10): {session.answers.get('aesthetics', '5')}
-- Upgradeability: {session.answers.get('upgradeability', 'I might upgrade')}
-- Extra notes: {session.answers.get('extra_notes', '')}
-
 SPECIAL HANDLING FOR OPEN-ENDED INPUTS:
 - If the user asked for budget advice (like "what's a good budget for gaming"), recommend a sensible budget range in your description
 - If they mentioned specific games or use cases in their budget answer, incorporate that into the build recommendations
@@ -445,37 +557,13 @@ Parts to prefer:
 - Motherboards with built in wifi/bluetooth
 
 PERFORMANCE TIERLIST (reference only):
-RTX 5090 32GB............... 100
-RTX Pro 6000 Blackwell 96GB.  90
-RX 7900 XTX 24GB............  75
-RTX 5080 16GB...............  74
-RX 9070 XT 16GB.............  67
-RTX 5070 Ti 16GB............  66
-RX 9070 16GB................  62
-RTX 4070 Ti Super 16GB......  61
-RTX 5070 12GB...............  55
-RTX 4070 Super 12GB.........  53
-RTX 4070 12GB...............  51
-RX 7800 XT 16GB.............  50
-RTX 5060 Ti 16GB............  48
-RTX 5060 Ti 8GB.............  47
-RX 9060 XT 16GB.............  46
-RTX 4060 Ti 8GB.............  45
-RTX 5060 8GB................  44
-RX 9060 XT 8GB..............  44
-Intel Arc B580 12GB.........  42
-RTX 4060 8GB................  40
-RX 7600 8GB.................  38
-RTX 3060 12GB...............  35
-RTX 5050 8GB................  34
-RTX 3050 6GB................  28
-
+""" + _TIERLIST + """
 OUTPUT FORMAT (strict):
 - Start with a single-line build name.
 - Then write 2-3 short paragraphs describing:
-  • Why this build fits {session.answers.get('use_case', 'General use')} and the aesthetic focus
+  • Why this build fits the user's use case and the aesthetic focus
   • Expected performance and thermals/noise
-  • How the look matches {session.answers.get('color', 'Black')}/{session.answers.get('rgb_level', '5')} and the upgrade path
+  • How the look matches the user's color scheme/RGB preference and the upgrade path
 - Add the exact title: COMPONENT BREAKDOWN
   Then list components in this exact order, one line each:
   CPU, SSD, (optional) HDD, Case, Power Supply, CPU Cooler, Graphics Card, RAM, Motherboard, (optional) Fans
@@ -505,9 +593,304 @@ FINAL CHECKS BEFORE YOU FINISH:
 - Keep the exact section titles so the UI can parse them.
 - VERIFY: You have selected a Case from the catalog. The Case line must show a specific case model, not "None" or be missing.
 """
+
+# Compression/summary prompts: instructions and example first, per-call text last, so the
+# request prefix is byte-identical across calls
+_COMPRESSION_PREAMBLE = """Create a compressed PC build entry like this example format:
+
+white
+8/10
+7/10
+fortnite
+mid-range
+EN: user showed confusion about amd and nvidia, wanted a build around fortnite
+RTX5060
+2TB SSD
+AMD CPU
+RAM
+Motherboard
+PSU
+Case
+loved it
+
+Respond with ONLY the compressed entry, one item per line, no labels or formatting.
+
+Based on this conversation and build:
+"""
+
+_SUMMARY_PREAMBLE = """Compress this Discord PC building conversation into 1-2 sentences maximum. Focus on key user needs and confusion.
+Respond with just the compressed summary, no formatting.
+
+Conversation:
+"""
+
+@lru_cache(maxsize=2048)
+def _format_message_line(role: str, text: str) -> str:
+    """Render one chat message as a prompt line; repeated greetings and replies hit the cache"""
+    text = text.strip()
+    return f"{role.capitalize()}: {text}" if text else ""
+
+class ConversationalFlow:
+    """Handles open-ended conversational PC building flow"""
+    
+    REQUIRED_FIELDS = ['budget', 'color', 'rgb_level', 'aesthetics', 'use_case', 'upgradeability', 'extra_notes']
+    
+    def __init__(self):
+        self.preloaded_greeting = "Hey! I'm your AI PC builder. What's your budget for this build?"
+    
+    @staticmethod
+    def _format_lines(messages):
+        out = []
+        for m in messages:
+            line = _format_message_line(m.get('role', 'assistant'), m.get('text') or '')
+            if line:
+                out.append(line)
+        return out
+    
+    def format_history(self, session: PCBuilderSession):
+        """Format chat history for Gemini prompt, appending only messages added since the last call"""
+        history = session.chat_history  # bounded to the last CHAT_HISTORY_LIMIT messages
+        version = session._history_version
+        cached = session._history_cache
+        if cached:
+            cached_version, cached_len, text = cached
+            if cached_version == version and cached_len == len(history):
+                return text
+            added = version - cached_version
+            # Nothing evicted or cleared since the cached render - format just the new tail
+            if added > 0 and cached_len + added == len(history):
+                new_lines = self._format_lines(islice(history, cached_len, None))
+                text = "\n".join([text, *new_lines]) if text else "\n".join(new_lines)
+                session._history_cache = (version, len(history), text)
+                return text
+        
+        text = "\n".join(self._format_lines(history))
+        session._history_cache = (version, len(history), text)
+        return text
+    
+    def build_conversation_prompt(self, session: PCBuilderSession):
+        """Build the conversational prompt for Gemini"""
+        history_text = self.format_history(session)
+        answers = session.answers
+        answers_text = "\n".join([f"- {k}: {answers.get(k)}" for k in self.REQUIRED_FIELDS if answers.get(k)])
+        missing = [k for k in self.REQUIRED_FIELDS if not answers.get(k)]
+        missing_text = ", ".join(missing) if missing else "none"
+        
+        return (
+            f"{_CONVERSATION_PROMPT_HEAD}{self.preloaded_greeting}\n\n"
+            f"Conversation so far:\n{history_text}\n\n"
+            f"Collected answers so far (if any):\n{answers_text or 'none'}\n\n"
+            f"{_CONVERSATION_PROMPT_FIELDS}Missing fields: {missing_text}{_CONVERSATION_PROMPT_TAIL}"
+        )
+
+class PromptCache:
+    """Persistent cache of Gemini responses keyed by a hash of the full prompt"""
+    
+    def __init__(self, db_file: str, max_age_hours: int = 24):
+        self.max_age = max_age_hours * 3600
+        # Queries run in worker threads; the lock serializes use of the shared connection
+        self._lock = threading.Lock()
+        try:
+            self.conn = sqlite3.connect(db_file, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, response TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses (created)")
+            self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Prompt cache disabled: {e}")
+            self.conn = None
+    
+    @staticmethod
+    def make_key(prompt: str) -> str:
+        return hashlib.blake2b(prompt.encode('utf-8')).hexdigest()
+    
+    async def get(self, prompt: str) -> Optional[str]:
+        """Return a cached response for this prompt, if one is fresh"""
+        if self.conn is None:
+            return None
+        return await asyncio.to_thread(self._get, self.make_key(prompt))
+    
+    async def set(self, prompt: str, response: str):
+        """Store a response for this prompt"""
+        if self.conn is None:
+            return
+        await asyncio.to_thread(self._set, self.make_key(prompt), response)
+    
+    def _get(self, key: str) -> Optional[str]:
+        try:
+            with self._lock:
+                row = self.conn.execute(
+                    "SELECT response, created FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Error reading prompt cache: {e}")
+            return None
+        if row and time.time() - row[1] < self.max_age:
+            return row[0]
+        return None
+    
+    def _set(self, key: str, response: str):
+        now = time.time()
+        try:
+            with self._lock:
+                # Expired rows would never be served again - drop them instead of letting the file grow
+                self.conn.execute("DELETE FROM responses WHERE created < ?", (now - self.max_age,))
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, created) VALUES (?, ?, ?)",
+                    (key, response, now)
+                )
+                self.conn.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Error writing prompt cache: {e}")
+
+class ResponseLRU:
+    """Bounded in-memory cache of Gemini responses keyed on a normalized prompt"""
+    
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+    
+    @staticmethod
+    def make_key(prompt: str) -> str:
+        # Whitespace and case differences between otherwise identical prompts share an entry
+        return PromptCache.make_key(" ".join(prompt.split()).lower())
+    
+    def get(self, prompt: str) -> Optional[str]:
+        key = self.make_key(prompt)
+        response = self.entries.get(key)
+        if response is not None:
+            self.entries.move_to_end(key)
+        return response
+    
+    def set(self, prompt: str, response: str):
+        key = self.make_key(prompt)
+        self.entries[key] = response
+        self.entries.move_to_end(key)
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+class PCBuildGenerator:
+    """Handles PC build generation and refinement using Gemini"""
+    
+    def __init__(self):
+        genai.configure(api_key=API_KEY)
+        self.model = genai.GenerativeModel("gemini-1.5-pro-latest")
+        # Keys include the full catalog, so catalog edits invalidate naturally
+        self.prompt_cache = PromptCache(PROMPT_CACHE_FILE)
+        # Gemini calls block for seconds; a pool of their own keeps them from starving the default
+        # executor that session, prompt-cache and collective-file I/O run on
+        self._gemini_pool = ThreadPoolExecutor(max_workers=GEMINI_CONCURRENCY, thread_name_prefix='gemini')
+        # (st_mtime_ns, parsed content) - reloaded only when the file changes
+        self._parts_cache: Optional[Tuple[int, str]] = None
+        self._image_cache: Optional[Tuple[int, Dict[str, str]]] = None
+        self._static_prompt_cache: Optional[Tuple[str, str]] = None
+    
+    def load_parts_data(self) -> str:
+        """Load the latest parts data (cached until the file's mtime changes)"""
+        global parts_data_available
+        try:
+            mtime = os.stat(PARTS_DATA_FILE).st_mtime_ns
+            parts_data_available = True
+            if self._parts_cache and self._parts_cache[0] == mtime:
+                return self._parts_cache[1]
+            with open(PARTS_DATA_FILE, 'r', encoding='utf-8') as f:
+                content = f.read()
+            if not content.strip():
+                logger.warning(f"Parts data file is empty: {PARTS_DATA_FILE}")
+                return ""
+            self._parts_cache = (mtime, content)
+            return content
+        except FileNotFoundError:
+            parts_data_available = False
+            logger.error(f"Parts data file not found: {PARTS_DATA_FILE}")
+            logger.error("Please ensure the parts data file exists in the same directory as the bot")
+            return ""
+        except Exception as e:
+            logger.error(f"Error loading parts data: {e}")
+            return ""
+    
+    def load_image_cache(self) -> Dict[str, str]:
+        """Load image cache (cached until the file's mtime changes)"""
+        try:
+            mtime = os.stat(IMAGE_CACHE_FILE).st_mtime_ns
+            if self._image_cache and self._image_cache[0] == mtime:
+                return self._image_cache[1]
+            with open(IMAGE_CACHE_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            images = data.get('images', {})
+            self._image_cache = (mtime, images)
+            return images
+        except FileNotFoundError:
+            return {}
+        except Exception as e:
+            logger.error(f"Error loading image cache: {e}")
+            return {}
+    
+    async def generate_text(self, prompt: str, timeout: int = 30) -> str:
+        """Run a blocking Gemini request on the Gemini pool so the event loop stays responsive"""
+        response = await asyncio.get_running_loop().run_in_executor(
+            self._gemini_pool, partial(self.model.generate_content, prompt, request_options={'timeout': timeout})
+        )
+        return getattr(response, 'text', '') or ''
+    
+    def build_prompt(self, session: PCBuilderSession, parts_data: str) -> str:
+        """Build the Gemini prompt"""
+        
+        # Extract budget value for calculations - handle open-ended inputs
+        budget_text = session.answers.get('budget', '$1000')
+        budget_match = _BUDGET_RE.search(budget_text.replace(',', ''))
+        
+        if budget_match:
+            budget_val = int(budget_match.group())
+            # Calculate adjusted budget (85% or -$200, whichever is less)
+            reduced = int(budget_val * 0.85)
+            adjusted_budget = min(reduced, budget_val - 200)
+            if budget_val - adjusted_budget < 200:
+                adjusted_budget = budget_val - 200
+            price_range = f"MAXIMUM TOTAL BUDGET: ${adjusted_budget} (absolute maximum, do not exceed)"
+        else:
+            # Handle open-ended budget requests
+            budget_lower = budget_text.lower()
+            if any(word in budget_lower for word in ['fortnite', 'gaming', 'game']):
+                # Default gaming budget if they asked about gaming
+                adjusted_budget = 800
+                price_range = f"RECOMMENDED GAMING BUDGET: ${adjusted_budget} (good for competitive gaming like Fortnite)"
+            elif any(word in budget_lower for word in ['budget', 'cost', 'price', 'spend', 'afford']):
+                # Default mid-range budget for general advice
+                adjusted_budget = 1200
+                price_range = f"RECOMMENDED BUDGET: ${adjusted_budget} (balanced performance and value)"
+            else:
+                # Default budget
+                adjusted_budget = 1000
+                price_range = f"RECOMMENDED BUDGET: ${adjusted_budget} (good starting point)"
+        
+        # The catalog/rules/tierlist block is identical across users; only this tail varies
+        context = f"""
+BUDGET AND CONTEXT:
+- Absolute budget cap: ${adjusted_budget if adjusted_budget else 'use max in context'}.
+- Max total budget: {price_range}
+- Use case: {session.answers.get('use_case', 'General use')}
+- Color scheme: {session.answers.get('color', 'Black')}
+- RGB preference (0-10): {session.answers.get('rgb_level', '5')}
+- Aesthetics priority (0-10): {session.answers.get('aesthetics', '5')}
+- Upgradeability: {session.answers.get('upgradeability', 'I might upgrade')}
+- Extra notes: {session.answers.get('extra_notes', '')}
+"""
+        return self._static_build_prompt(parts_data) + context
+    
+    def _static_build_prompt(self, parts_data: str) -> str:
+        """Catalog, rules and output format part of the build prompt, rebuilt only when the catalog changes"""
+        # load_parts_data hands back the same string object until the file's mtime changes
+        if self._static_prompt_cache and self._static_prompt_cache[0] is parts_data:
+            return self._static_prompt_cache[1]
+        
+        prompt = f"{_BUILD_PROMPT_HEAD}{parts_data}{_BUILD_PROMPT_TAIL}"
+        self._static_prompt_cache = (parts_data, prompt)
         return prompt
     
-    async def generate_build(self, session: PCBuilderSession) -> str:
+    async def generate_build(self, session: PCBuilderSession, use_cache: bool = True) -> str:
         """Generate a PC build based on session answers"""
         try:
             logger.info(f"Starting build generation for user {session.user_id}")
@@ -522,14 +905,25 @@ FINAL CHECKS BEFORE YOU FINISH:
             prompt = self.build_prompt(session, parts_data)
             logger.info(f"Generated prompt: {len(prompt)} characters")
             
-            response = self.model.generate_content(prompt, request_options={'timeout': 30})
+            # session.answers is never filled in, so the prompt alone is the same for every
+            # user - key on the conversation too so one user's build is never served to another
+            conversation = "\n".join(ConversationalFlow._format_lines(session.chat_history))
+            cache_key = f"{prompt}\n{conversation}"
+            
+            if use_cache:
+                cached = await self.prompt_cache.get(cache_key)
+                if cached:
+                    logger.info(f"Serving build for user {session.user_id} from prompt cache")
+                    return cached
+            
+            result = await self.generate_text(prompt, timeout=30)
             logger.info("Received response from Gemini")
             
-            result = getattr(response, 'text', '') or ''
             if not result:
                 logger.error("Empty response from Gemini")
                 return "❌ Error: Could not generate build recommendation. Please try again."
             
+            await self.prompt_cache.set(cache_key, result)
             logger.info(f"Generated build result: {len(result)} characters")
             return result
             
@@ -581,12 +975,16 @@ Instructions:
 Remember: You're helping them get the perfect PC, so be enthusiastic and knowledgeable!
 """
             
-            response = self.model.generate_content(prompt, request_options={'timeout': 30})
-            result = getattr(response, 'text', '') or ''
+            cached = await self.prompt_cache.get(prompt)
+            if cached:
+                return cached
+            
+            result = await self.generate_text(prompt, timeout=30)
             
             if not result:
                 return "I'm here to help! What would you like to know about your build or what changes are you thinking about?"
             
+            await self.prompt_cache.set(prompt, result)
             return result
             
         except Exception as e:
@@ -595,78 +993,251 @@ Remember: You're helping them get the perfect PC, so be enthusiastic and knowled
 
 # Initialize components
 session_manager = SessionManager()
+atexit.register(session_manager.flush_on_exit)
 conversational_flow = ConversationalFlow()
 build_generator = PCBuildGenerator()
+response_cache = ResponseLRU()
+
+_BATCH_PROMPT_HEAD = """You will receive several independent tasks, each wrapped in <task N> ... </task N> markers.
+Complete every task on its own, exactly as instructed inside it.
+Respond with ONLY a JSON array of strings with one element per task, where element N-1 is the complete answer to task N. No other text.
+"""
+_JSON_FENCE_RE = re.compile(r'^```(?:json)?\s*|\s*```$')
+
+class GeminiBatcher:
+    """Coalesces small independent prompts into one Gemini request
+
+    A batch can carry several users' conversations in one model context, so it is only used
+    for collective-file compression and only when GEMINI_BATCHING is on; each answer is only
+    ever returned to the caller that submitted its task.
+    """
+    
+    def __init__(self, generator: PCBuildGenerator, max_items: int = GEMINI_BATCH_SIZE, window: float = GEMINI_BATCH_WINDOW):
+        self.generator = generator
+        self.max_items = max_items
+        self.window = window
+        self.queue = asyncio.Queue()
+        self._worker = None
+        self._inflight = set()
+    
+    async def submit(self, prompt: str, timeout: int) -> str:
+        """Queue a prompt and wait for its answer"""
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((prompt, timeout, future))
+        return await future
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_items:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            # Dispatch in the background so the next window can fill while this one is in flight
+            task = asyncio.create_task(self._dispatch(batch))
+            self._inflight.add(task)
+            task.add_done_callback(self._inflight.discard)
+    
+    async def _dispatch(self, batch):
+        results = None
+        if len(batch) > 1:
+            prompt = self._combine([item[0] for item in batch])
+            # A longer reply is expected for every extra task in the request
+            timeout = max(item[1] for item in batch) + GEMINI_BATCH_TIMEOUT_PER_TASK * (len(batch) - 1)
+            try:
+                reply = await self.generator.generate_text(prompt, timeout=timeout)
+                results = self._split(reply, len(batch))
+                if results is None:
+                    logger.warning(f"Batched Gemini reply didn't match {len(batch)} tasks, retrying individually")
+            except Exception as e:
+                # Hand the failure straight to the callers; their own retry policy decides what's next
+                logger.warning(f"Batched Gemini request for {len(batch)} tasks failed: {e}")
+                results = [e] * len(batch)
+        if results is None:
+            results = await asyncio.gather(
+                *(self.generator.generate_text(prompt, timeout=timeout) for prompt, timeout, _ in batch),
+                return_exceptions=True
+            )
+        
+        for (_, _, future), result in zip(batch, results):
+            if future.done():
+                continue  # caller gave up
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+    
+    @staticmethod
+    def _combine(prompts):
+        tasks = "\n".join(f"<task {i}>\n{prompt.strip()}\n</task {i}>" for i, prompt in enumerate(prompts, 1))
+        # The header is byte-identical for every batch; only the count and tasks follow it
+        return f"{_BATCH_PROMPT_HEAD}Number of tasks: {len(prompts)}\n\n{tasks}"
+    
+    @staticmethod
+    def _split(reply: str, count: int) -> Optional[List[str]]:
+        """Parse the JSON array reply; None if it doesn't line up with the tasks"""
+        try:
+            answers = json.loads(_JSON_FENCE_RE.sub('', reply.strip()))
+        except ValueError:
+            return None
+        if not isinstance(answers, list) or len(answers) != count or not all(isinstance(a, str) for a in answers):
+            return None
+        return answers
+
+gemini_batcher = GeminiBatcher(build_generator)
+
+class AppendQueue:
+    """Buffers records for one file and appends them in batches from a single background writer"""
+    
+    def __init__(self, write_batch):
+        self.write_batch = write_batch  # called with a list of records in a worker thread
+        self.queue = asyncio.Queue()
+        self._worker = None
+        self._pending = None  # batch taken off the queue but not yet handed to a thread
+    
+    def start(self):
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._run())
+    
+    def put(self, record):
+        """Queue a record without waiting for the write"""
+        self.queue.put_nowait(record)
+        self.start()
+    
+    def _drain(self, batch):
+        while True:
+            try:
+                batch.append(self.queue.get_nowait())
+            except asyncio.QueueEmpty:
+                return batch
+    
+    async def _run(self):
+        while True:
+            # Everything queued while the previous batch was being written goes out together
+            batch = self._pending = self._drain([await self.queue.get()])
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                logger.error(f"Error appending {len(batch)} records: {e}")
+    
+    def _write(self, batch):
+        self._pending = None  # the thread owns it now; it finishes even if the task is cancelled
+        self.write_batch(batch)
+    
+    def flush_on_exit(self):
+        """Synchronously write whatever is still queued (atexit hook)"""
+        batch = self._drain(self._pending or [])
+        self._pending = None
+        if batch:
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                logger.error(f"Error appending {len(batch)} records on exit: {e}")
+
+# Short first attempt; a transient failure gets one longer retry before callers fall back
+GEMINI_RETRY_TIMEOUTS = (5, 10)
+TRANSIENT_GEMINI_ERRORS = (
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.ResourceExhausted,
+)
+
+async def cached_generate(prompt: str, timeouts: Tuple[int, ...] = GEMINI_RETRY_TIMEOUTS, batch: bool = False) -> str:
+    """Gemini call for the compression/summary prompts, answered from memory when repeated
+
+    With batch=True the prompt may share a request with other users' prompts (only if GEMINI_BATCHING is on).
+    """
+    cached = response_cache.get(prompt)
+    if cached is not None:
+        return cached
+    for attempt, timeout in enumerate(timeouts, 1):
+        try:
+            if batch and GEMINI_BATCHING:
+                text = await gemini_batcher.submit(prompt, timeout)
+            else:
+                text = await build_generator.generate_text(prompt, timeout=timeout)
+            text = text.strip()
+            break
+        except TRANSIENT_GEMINI_ERRORS as e:
+            if attempt == len(timeouts):
+                raise
+            logger.warning(f"Transient Gemini error ({type(e).__name__}), retrying with a {timeouts[attempt]}s timeout")
+    if text:
+        response_cache.set(prompt, text)
+    return text
+
+# Keyword groups for the backup field detection, matched as substrings of the chat text
+FIELD_KEYWORDS = {
+    'budget': frozenset({'$', 'dollar', 'budget', 'price', 'cost', 'around', 'under', 'over'}),
+    'color': frozenset({'black', 'white', 'red', 'blue', 'green', 'pink', 'purple', 'rgb'}),
+    'rgb_level': frozenset({'rgb', 'light', 'led', 'none', 'lots', 'some'}),
+    'aesthetics': frozenset({'look', 'aesthetic', 'style', 'performance', 'balanced'}),
+    'use_case': frozenset({'fortnite', 'league', 'minecraft', 'valorant', 'gaming', 'streaming', 'work'}),
+    'upgradeability': frozenset({'upgrade', 'wont', "won't", 'might', 'will', 'nah'}),
+    'extra_notes': frozenset({'special', 'request', 'requirement', 'need', 'want', 'none', 'no', 'nah'}),
+}
+FIELD_PATTERNS = {
+    field: re.compile('|'.join(re.escape(word) for word in sorted(words)))
+    for field, words in FIELD_KEYWORDS.items()
+}
+DIGIT_RE = re.compile(r'\d')
+NUMBER_RE = re.compile(r'\d+')
+_REQUIRED_FIELD_SET = frozenset(FIELD_KEYWORDS)
 
 def are_all_fields_collected(session):
     """Check if all required fields have been collected"""
-    required_fields = conversational_flow.REQUIRED_FIELDS
-    collected_fields = set()
-    
-    # Check session.answers
-    for field in required_fields:
-        if field in session.answers and session.answers[field]:
-            collected_fields.add(field)
+    answers = session.answers
+    collected_fields = {field for field in _REQUIRED_FIELD_SET if answers.get(field)}
+    if collected_fields >= _REQUIRED_FIELD_SET:
+        return True
     
     # Also check chat history for any additional information
-    chat_text = " ".join([msg.get('text', '') for msg in session.chat_history]).lower()
-    
-    # Look for budget mentions
-    if 'budget' not in collected_fields:
-        if any(word in chat_text for word in ['$', 'dollar', 'budget', 'price', 'cost', 'around', 'under', 'over']):
-            if any(char.isdigit() for char in chat_text):
-                collected_fields.add('budget')
-    
-    # Look for color mentions
-    if 'color' not in collected_fields:
-        colors = ['black', 'white', 'red', 'blue', 'green', 'pink', 'purple', 'rgb']
-        if any(color in chat_text for color in colors):
-            collected_fields.add('color')
-    
-    # Look for rgb mentions
-    if 'rgb_level' not in collected_fields:
-        if any(word in chat_text for word in ['rgb', 'light', 'led', 'none', 'lots', 'some']):
-            collected_fields.add('rgb_level')
-    
-    # Look for aesthetics mentions
-    if 'aesthetics' not in collected_fields:
-        if any(word in chat_text for word in ['look', 'aesthetic', 'style', 'performance', 'balanced']):
-            collected_fields.add('aesthetics')
-    
-    # Look for use case mentions
-    if 'use_case' not in collected_fields:
-        games = ['fortnite', 'league', 'minecraft', 'valorant', 'gaming', 'streaming', 'work']
-        if any(game in chat_text for game in games):
-            collected_fields.add('use_case')
-    
-    # Look for upgrade mentions
-    if 'upgradeability' not in collected_fields:
-        if any(word in chat_text for word in ['upgrade', 'wont', "won't", 'might', 'will', 'nah']):
-            collected_fields.add('upgradeability')
-    
-    # Look for extra notes
-    if 'extra_notes' not in collected_fields:
-        if any(word in chat_text for word in ['special', 'request', 'requirement', 'need', 'want', 'none', 'no', 'nah']):
-            collected_fields.add('extra_notes')
-    
-    # Check if we have all 7 fields
-    essential_fields = ['budget', 'color', 'rgb_level', 'aesthetics', 'use_case', 'upgradeability', 'extra_notes']
-    essential_collected = sum(1 for field in essential_fields if field in collected_fields)
-    
-    return essential_collected >= 7
+    chat_text = session.get_chat_text_lower()
+    
+    for name, pattern in FIELD_PATTERNS.items():
+        if name in collected_fields:
+            continue
+        if pattern.search(chat_text):
+            # A budget mention only counts alongside an actual number
+            if name == 'budget' and not DIGIT_RE.search(chat_text):
+                continue
+            collected_fields.add(name)
+    
+    return collected_fields >= _REQUIRED_FIELD_SET
+
+BUILD_HEADER_MARKER = b'=== BUILD #'
+READ_CHUNK_SIZE = 65536
 
 def get_build_number():
     """Get the next build number"""
     collective_file = os.path.join(SCRIPT_DIR, 'collective_builds.txt')
-    if os.path.exists(collective_file):
-        try:
-            with open(collective_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                build_count = content.count('=== BUILD #')
-                return build_count + 1
-        except:
-            return 1
-    return 1
+    try:
+        # Count headers over raw bytes in chunks - no full-file read or UTF-8 decode
+        build_count = 0
+        carry = b''
+        with open(collective_file, 'rb', buffering=READ_CHUNK_SIZE) as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+                data = carry + chunk
+                build_count += data.count(BUILD_HEADER_MARKER)
+                # Keep a tail shorter than the marker so a header split across chunks still matches once
+                carry = data[-(len(BUILD_HEADER_MARKER) - 1):]
+        return build_count + 1
+    except FileNotFoundError:
+        return 1  # nothing saved yet
+    except OSError as e:
+        logger.error(f"Error counting collective builds: {e}")
+        return 1
+
+# Conversation + build text shorter than this is formatted locally instead of via Gemini
+MIN_AI_COMPRESSION_CHARS = 200
 
 async def save_build_to_collective_file(session):
     """Save completed build to collective file with AI-generated compressed responses"""
@@ -676,163 +1247,247 @@ async def save_build_to_collective_file(session):
         build_text = session.build_result[:1000] if session.build_result else ""
         feedback_text = session.user_feedback if session.user_feedback else ""
         
-        # Create AI prompt for compressed entry
-        compression_prompt = f"""
-Create a compressed PC build entry like this example format:
-
-white
-8/10
-7/10
-fortnite
-mid-range
-EN: user showed confusion about amd and nvidia, wanted a build around fortnite
-RTX5060
-2TB SSD
-AMD CPU
-RAM
-Motherboard
-PSU
-Case
-loved it
-
-Based on this conversation and build:
-CONVERSATION: {conversation_text}
-BUILD: {build_text}
-FEEDBACK: {feedback_text}
-
-Respond with ONLY the compressed entry, one item per line, no labels or formatting.
-"""
+        compressed_entry = ""
+        # Too little to be worth compressing with AI - the local format covers it
+        if len(conversation_text) + len(build_text) >= MIN_AI_COMPRESSION_CHARS:
+            # Create AI prompt for compressed entry
+            compression_prompt = (
+                f"{_COMPRESSION_PREAMBLE}CONVERSATION: {conversation_text}\n"
+                f"BUILD: {build_text}\n"
+                f"FEEDBACK: {feedback_text}\n"
+            )
+            try:
+                compressed_entry = await cached_generate(compression_prompt, batch=True)
+            except Exception as e:
+                logger.warning(f"AI compression failed, using the local entry format: {e}")
         
-        try:
-            response = build_generator.model.generate_content(compression_prompt, request_options={'timeout': 15})
-            compressed_entry = getattr(response, 'text', '').strip()
-            
-            if not compressed_entry:
-                # Fallback to old method if AI fails
-                params = extract_simplified_params(session)
-                ai_notes = extract_ai_notes(session)
-                parts = extract_parts_from_build(session.build_result)
-                user_feedback = session.user_feedback
-                compressed_entry = format_collective_entry(params, ai_notes, parts, user_feedback)
-        except:
-            # Fallback to old method if AI fails
+        if not compressed_entry:
+            # Fallback to old method if AI fails or was skipped
             params = extract_simplified_params(session)
             ai_notes = extract_ai_notes(session)
-            parts = extract_parts_from_build(session.build_result)
+            parts = session.get_parsed_build().parts
             user_feedback = session.user_feedback
             compressed_entry = format_collective_entry(params, ai_notes, parts, user_feedback)
         
-        # Add timestamp and build number
+        # Numbered and written by the collective writer task
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        build_number = get_build_number()
-        
-        # Write to collective file with file locking
-        collective_file = os.path.join(SCRIPT_DIR, 'collective_builds.txt')
-        with FileLock(COLLECTIVE_LOCK_FILE):
-            with open(collective_file, 'a', encoding='utf-8') as f:
-                f.write(f"=== BUILD #{build_number} - {timestamp} ===\n")
-                f.write(compressed_entry)
-                f.write('\n\n')
-            
-        logger.info(f"Saved AI-compressed build #{build_number} to collective file")
+        collective_writer.put((timestamp, compressed_entry))
         
     except Exception as e:
         logger.error(f"Error saving to collective file: {e}")
 
+# Next collective build number; counted from the file on the first save, then kept in
+# memory (the instance lock means nothing else appends to the file)
+next_build_number: Optional[int] = None
+
+def append_collective_entries(entries):
+    """Number and append (timestamp, entry) pairs to the collective file (runs in a worker thread)"""
+    global next_build_number
+    collective_file = os.path.join(SCRIPT_DIR, 'collective_builds.txt')
+    if next_build_number is None:
+        next_build_number = get_build_number()
+    first_number = next_build_number
+    chunks = []
+    for build_number, (timestamp, entry) in enumerate(entries, first_number):
+        chunks.append(f"=== BUILD #{build_number} - {timestamp} ===\n{entry}\n\n")
+    with open(collective_file, 'a', encoding='utf-8') as f:
+        f.write(''.join(chunks))
+    next_build_number = first_number + len(entries)
+    logger.info(f"Saved {len(entries)} AI-compressed build(s) from #{first_number} to collective file")
+
+def append_compressed_sessions(records):
+    """Append compressed session records (runs in a worker thread)"""
+    sessions_file = os.path.join(SCRIPT_DIR, 'discord_sessions_compressed.txt')
+    with open(sessions_file, 'a', encoding='utf-8') as f:
+        f.write(''.join(records))
+
+collective_writer = AppendQueue(append_collective_entries)
+compressed_sessions_writer = AppendQueue(append_compressed_sessions)
+atexit.register(collective_writer.flush_on_exit)
+atexit.register(compressed_sessions_writer.flush_on_exit)
+
+_SIMPLIFIED_KEYS = ('budget', 'color', 'rgb_level', 'aesthetics', 'use_case', 'upgradeability', 'extra_notes')
+
 def extract_simplified_params(session):
     """Extract simplified user parameters from session"""
-    params = {}
-    
-    # Extract key parameters from answers
-    if 'budget' in session.answers:
-        budget = session.answers['budget']
-        # Simplify budget
-        if 'around' in budget.lower() or 'about' in budget.lower():
-            params['budget'] = budget
-        else:
-            params['budget'] = budget
-    
-    if 'color' in session.answers:
-        params['color'] = session.answers['color']
-    
-    if 'rgb_level' in session.answers:
-        params['rgb_level'] = session.answers['rgb_level']
-    
-    if 'aesthetics' in session.answers:
-        params['aesthetics'] = session.answers['aesthetics']
-    
-    if 'use_case' in session.answers:
-        params['use_case'] = session.answers['use_case']
-    
-    if 'upgradeability' in session.answers:
-        params['upgradeability'] = session.answers['upgradeability']
-    
-    if 'extra_notes' in session.answers:
-        params['extra_notes'] = session.answers['extra_notes']
-    
-    return params
+    answers = session.answers
+    return {key: answers[key] for key in _SIMPLIFIED_KEYS if key in answers}
+
+# Keywords scanned for in chat text, each mapped to the tags the note/concern logic checks.
+# Matching is by substring, like the `word in chat_text` checks this replaces.
+_NOTE_GAMES = ('fortnite', 'league', 'minecraft', 'valorant', 'csgo', 'cyberpunk', 'elden ring')
+_CONCERN_GAMES = ('fortnite', 'league', 'minecraft')
+_KEYWORD_TAGS = {
+    'amd': ('amd',),
+    'nvidia': ('nvidia',),
+    'idk': ('unsure',),
+    'dont know': ('unsure',),
+    "don't know": ('unsure',),
+    'not sure': ('unsure',),
+    'maybe': ('maybe',),
+    'confused': ('confused',),
+    'which': ('comparison',),
+    'better': ('comparison',),
+    'budget': ('budget', 'budget_concern'),
+    'price': ('budget',),
+    'cost': ('budget',),
+    'expensive': ('budget_concern',),
+    'too much': ('budget_concern',),
+    'color': ('color',),
+    'colour': ('color',),
+    'theme': ('color',),
+    'rgb': ('rgb',),
+    'light': ('rgb',),
+    'led': ('rgb',),
+    'resolution': ('resolution',),
+    '1080p': ('resolution',),
+    '1440p': ('resolution',),
+    '4k': ('resolution',),
+    'upgrade': ('upgrade',),
+    'upgrading': ('upgrade',),
+    **{game: (f'game:{game}',) for game in _NOTE_GAMES},
+}
+def _substring_alternation(words):
+    """Compile words into one pattern whose group 1 reports every occurrence, overlapping ones included"""
+    # Zero-width lookahead so every start position is tried, not just the end of the previous match
+    return re.compile('(?=(' + '|'.join(re.escape(word) for word in sorted(words, key=len, reverse=True)) + '))')
+
+_KEYWORD_RE = _substring_alternation(_KEYWORD_TAGS)
+
+# Tag groups for the compressed-session concerns
+_UNCERTAINTY_TAGS = frozenset({'unsure', 'maybe', 'confused'})
+_GPU_BRAND_TAGS = frozenset({'amd', 'nvidia'})
+_COMPARISON_TAGS = frozenset({'confused', 'comparison'})
+
+def _keyword_hits(chat_text):
+    """Set of keyword tags present in chat_text, from a single regex pass"""
+    hits = set()
+    for word in {match.group(1) for match in _KEYWORD_RE.finditer(chat_text)}:
+        hits.update(_KEYWORD_TAGS[word])
+    return hits
 
 def extract_ai_notes(session):
     """Extract AI notes about user confusion/needs from chat history"""
     notes = []
     
     # Look for patterns indicating confusion or specific needs
-    chat_text = " ".join([msg.get('text', '') for msg in session.chat_history]).lower()
+    hits = session.get_keyword_hits()
+    unsure = 'unsure' in hits
     
     # Check for AMD/NVIDIA confusion
-    if 'amd' in chat_text and 'nvidia' in chat_text:
+    if 'amd' in hits and 'nvidia' in hits:
         notes.append("user showed confusion about amd and nvidia")
     
     # Check for specific game mentions
-    games = ['fortnite', 'league', 'minecraft', 'valorant', 'csgo', 'cyberpunk', 'elden ring']
-    for game in games:
-        if game in chat_text:
-            notes.append(f"wanted a build around {game}")
-            break
+    game = next((game for game in _NOTE_GAMES if f'game:{game}' in hits), None)
+    if game:
+        notes.append(f"wanted a build around {game}")
     
     # Check for budget confusion
-    if any(word in chat_text for word in ['idk', 'dont know', "don't know", 'not sure', 'maybe']):
-        if any(word in chat_text for word in ['budget', 'price', 'cost']):
-            notes.append("user was unsure about budget")
+    if (unsure or 'maybe' in hits) and 'budget' in hits:
+        notes.append("user was unsure about budget")
     
     # Check for color confusion
-    if any(word in chat_text for word in ['idk', 'dont know', "don't know", 'not sure']):
-        if any(word in chat_text for word in ['color', 'colour', 'theme']):
-            notes.append("user was unsure about color preference")
+    if unsure and 'color' in hits:
+        notes.append("user was unsure about color preference")
     
     # Check for RGB confusion
-    if any(word in chat_text for word in ['idk', 'dont know', "don't know", 'not sure']):
-        if any(word in chat_text for word in ['rgb', 'light', 'led']):
-            notes.append("user was unsure about rgb preference")
+    if unsure and 'rgb' in hits:
+        notes.append("user was unsure about rgb preference")
     
     # Check for resolution questions
-    if any(word in chat_text for word in ['resolution', '1080p', '1440p', '4k']):
+    if 'resolution' in hits:
         notes.append("user asked about resolution preferences")
     
     # Check for upgrade confusion
-    if any(word in chat_text for word in ['upgrade', 'upgrading']):
-        if any(word in chat_text for word in ['idk', 'dont know', "don't know", 'not sure', 'maybe']):
-            notes.append("user was unsure about upgrade plans")
+    if 'upgrade' in hits and (unsure or 'maybe' in hits):
+        notes.append("user was unsure about upgrade plans")
     
     # If no specific notes, check for general confusion
-    if not notes:
-        if any(word in chat_text for word in ['idk', 'dont know', "don't know", 'not sure', 'maybe', 'confused']):
-            notes.append("user showed general uncertainty")
+    if not notes and (unsure or 'maybe' in hits or 'confused' in hits):
+        notes.append("user showed general uncertainty")
     
     return notes
 
-def extract_parts_from_build(build_result):
-    """Extract parts list from build result"""
-    parts = []
+# Part-name keyword -> (priority, label); the lowest priority present wins, matching the old elif order
+_PART_KEYWORDS = {
+    'rtx': (0, 'RTX5060'),  # Generic RTX
+    'ssd': (1, 'SSD'),
+    'nvme': (1, 'SSD'),
+    'ryzen': (2, 'AMD CPU'),
+    'intel': (3, 'Intel CPU'),
+    'ram': (4, 'RAM'),
+    'memory': (4, 'RAM'),
+    'motherboard': (5, 'Motherboard'),
+    'power supply': (6, 'PSU'),
+    'psu': (6, 'PSU'),
+    'case': (7, 'Case'),
+}
+_PART_CLASSIFIER = _substring_alternation(_PART_KEYWORDS)
+
+def classify_part(part_name):
+    """Map a part name to its short collective-file label, or None if it isn't a tracked component"""
+    name = part_name.lower()
+    best = min((_PART_KEYWORDS[match.group(1)] for match in _PART_CLASSIFIER.finditer(name)), default=None)
+    if best is None:
+        return None
+    label = best[1]
+    if label == 'SSD':
+        if '2tb' in name:
+            return '2TB SSD'
+        if '1tb' in name:
+            return '1TB SSD'
+    return label
+
+# Collective entries list at most this many parts
+ENTRY_MAX_PARTS = 8
+_CORE_PART_WORDS = ('cpu', 'gpu', 'rtx', 'ssd', 'ram', 'case', 'motherboard', 'power supply')
+
+def _is_part_line(line):
+    return ':' in line and not line.startswith('http') and len(line) < 200 and bool(line.strip())
+
+def parse_build(build_result):
+    """Split a generated build into its sections in a single pass over the lines"""
     lines = build_result.split('\n')
+    parsed = ParsedBuild(name=lines[0])
     
-    for line in lines:
-        if ':' in line and not line.startswith('http') and len(line) < 200:
-            # Extract component type and name
-            if line.strip():
-                parts.append(line.strip())
+    in_components = False
+    done_sections = False
+    for i, raw_line in enumerate(lines):
+        # Parts and price come from anywhere in the build, including the price check
+        if ':' in raw_line:
+            if len(parsed.parts) < ENTRY_MAX_PARTS and _is_part_line(raw_line):
+                parsed.parts.append(raw_line.strip())
+            if any(word in raw_line.lower() for word in _CORE_PART_WORDS):
+                part = raw_line.split(':', 1)[1].strip()
+                # Extract just the component name, not full description
+                if '(' in part:
+                    part = part.split('(')[0].strip()
+                parsed.part_names.append(part)
+        if parsed.total_price is None and 'TOTAL = $' in raw_line:
+            parsed.total_price = raw_line.split('TOTAL = $')[1].strip()
+        
+        # Description and component sections, as shown by send_build_result
+        if i == 0 or done_sections:
+            continue
+        line = raw_line.strip()
+        if not line:
+            continue
+        upper = line.upper()
+        if "COMPONENT BREAKDOWN" in upper:
+            in_components = True
+            continue
+        elif "DEBUG PRICE CHECK" in upper or "EXTRA NOTES" in upper:
+            done_sections = True
+            continue
+        
+        if in_components:
+            if not line.startswith('---'):
+                parsed.component_lines.append(line)
+        elif not line.startswith('#'):
+            parsed.description_lines.append(line)
     
-    return parts
+    return parsed
 
 def format_collective_entry(params, ai_notes, parts, user_feedback):
     """Format the collective entry in compressed format like the image example"""
@@ -854,10 +1509,9 @@ def format_collective_entry(params, ai_notes, parts, user_feedback):
     # RGB Level
     if 'rgb_level' in params:
         rgb = params['rgb_level']
-        import re
-        match = re.search(r'(\d+)', str(rgb))
+        match = NUMBER_RE.search(str(rgb))
         if match:
-            simplified_params.append(f"{match.group(1)}/10")
+            simplified_params.append(f"{match.group()}/10")
         elif 'none' in str(rgb).lower():
             simplified_params.append('0/10')
         elif 'lots' in str(rgb).lower() or 'max' in str(rgb).lower():
@@ -868,10 +1522,9 @@ def format_collective_entry(params, ai_notes, parts, user_feedback):
     # Aesthetics
     if 'aesthetics' in params:
         aesthetics = params['aesthetics']
-        import re
-        match = re.search(r'(\d+)', str(aesthetics))
+        match = NUMBER_RE.search(str(aesthetics))
         if match:
-            simplified_params.append(f"{match.group(1)}/10")
+            simplified_params.append(f"{match.group()}/10")
         elif 'performance' in str(aesthetics).lower():
             simplified_params.append('3/10')
         elif 'balanced' in str(aesthetics).lower():
@@ -898,10 +1551,9 @@ def format_collective_entry(params, ai_notes, parts, user_feedback):
     # Budget (simplified)
     if 'budget' in params:
         budget = params['budget'].lower()
-        import re
-        match = re.search(r'(\d+)', budget)
+        match = NUMBER_RE.search(budget)
         if match:
-            amount = int(match.group(1))
+            amount = int(match.group())
             if amount < 600:
                 simplified_params.append('budget')
             elif amount < 1000:
@@ -921,31 +1573,11 @@ def format_collective_entry(params, ai_notes, parts, user_feedback):
     # Parts (simplified)
     if parts:
         simplified_parts = []
-        for part in parts[:8]:  # Limit to 8 most important parts
+        for part in parts[:ENTRY_MAX_PARTS]:  # Limit to the most important parts
             if ':' in part:
-                part_name = part.split(':', 1)[1].strip()
-                # Extract key components
-                if 'rtx' in part_name.lower():
-                    simplified_parts.append('RTX5060')  # Generic RTX
-                elif 'ssd' in part_name.lower() or 'nvme' in part_name.lower():
-                    if '2tb' in part_name.lower():
-                        simplified_parts.append('2TB SSD')
-                    elif '1tb' in part_name.lower():
-                        simplified_parts.append('1TB SSD')
-                    else:
-                        simplified_parts.append('SSD')
-                elif 'ryzen' in part_name.lower():
-                    simplified_parts.append('AMD CPU')
-                elif 'intel' in part_name.lower():
-                    simplified_parts.append('Intel CPU')
-                elif 'ram' in part_name.lower() or 'memory' in part_name.lower():
-                    simplified_parts.append('RAM')
-                elif 'motherboard' in part_name.lower():
-                    simplified_parts.append('Motherboard')
-                elif 'power supply' in part_name.lower() or 'psu' in part_name.lower():
-                    simplified_parts.append('PSU')
-                elif 'case' in part_name.lower():
-                    simplified_parts.append('Case')
+                label = classify_part(part.split(':', 1)[1].strip())
+                if label:
+                    simplified_parts.append(label)
         
         if simplified_parts:
             entry.extend(simplified_parts)
@@ -968,14 +1600,20 @@ def format_collective_entry(params, ai_notes, parts, user_feedback):
     
     return '\n'.join(entry)
 
+# Shorter chats are summarized locally instead of via Gemini
+SUMMARY_MIN_MESSAGES = 4
+
 async def save_session_compressed(user_id, session):
     """Save session in compressed text format instead of JSON"""
+    if not session.chat_history and not session.build_result and not session.answers:
+        return  # nothing worth recording yet
     try:
         # Create compressed session data
         compressed_data = []
         
         # Add timestamp and user info with instance ID
-        compressed_data.append(f"[{session.last_activity}] User:{user_id} Instance:{INSTANCE_ID}")
+        last_activity = datetime.fromtimestamp(session.last_activity).isoformat()
+        compressed_data.append(f"[{last_activity}] User:{user_id} Instance:{INSTANCE_ID}")
         
         # Add all user settings with values
         if session.answers:
@@ -987,67 +1625,47 @@ async def save_session_compressed(user_id, session):
         
         # Add concerns/issues from chat
         concerns = []
-        chat_text = " ".join([msg.get('text', '') for msg in session.chat_history]).lower()
+        hits = session.get_keyword_hits()
         
-        if any(word in chat_text for word in ['confused', 'dont know', "don't know", 'not sure', 'idk', 'maybe']):
+        if hits & _UNCERTAINTY_TAGS:
             concerns.append('user uncertainty')
         
-        if any(word in chat_text for word in ['amd', 'nvidia']) and any(word in chat_text for word in ['confused', 'which', 'better']):
+        if hits & _GPU_BRAND_TAGS and hits & _COMPARISON_TAGS:
             concerns.append('gpu brand confusion')
         
-        if any(word in chat_text for word in ['expensive', 'too much', 'budget']):
+        if 'budget_concern' in hits:
             concerns.append('budget concerns')
         
-        if any(word in chat_text for word in ['fortnite', 'league', 'minecraft']):
-            game = next((word for word in ['fortnite', 'league', 'minecraft'] if word in chat_text), None)
-            if game:
-                concerns.append(f'game-specific: {game}')
+        game = next((game for game in _CONCERN_GAMES if f'game:{game}' in hits), None)
+        if game:
+            concerns.append(f'game-specific: {game}')
         
         if concerns:
             compressed_data.append(f"Concerns: {','.join(concerns)}")
         
-        # Add AI-generated conversation summary
-        if session.chat_history:
-            conversation_text = " ".join([f"{msg['role']}: {msg['text']}" for msg in session.chat_history[-8:]])
+        # Add conversation summary - AI-generated once there's enough conversation to be worth it
+        if 0 < len(session.chat_history) < SUMMARY_MIN_MESSAGES:
+            snippet = " / ".join(msg.get('text', '')[:80] for msg in session.chat_history)
+            compressed_data.append(f"Summary: {snippet}")
+        elif session.chat_history:
+            conversation_text = " ".join([f"{msg['role']}: {msg['text']}" for msg in list(session.chat_history)[-8:]])
             
             try:
-                summary_prompt = f"""
-Compress this Discord PC building conversation into 1-2 sentences maximum. Focus on key user needs and confusion:
-
-{conversation_text}
-
-Respond with just the compressed summary, no formatting.
-"""
-                response = build_generator.model.generate_content(summary_prompt, request_options={'timeout': 10})
-                summary = getattr(response, 'text', '').strip()
+                summary_prompt = f"{_SUMMARY_PREAMBLE}{conversation_text}\n"
+                summary = await cached_generate(summary_prompt)
                 if summary:
                     compressed_data.append(f"Summary: {summary}")
-            except:
+            except Exception as e:
+                logger.warning(f"AI summary failed: {e}")
                 compressed_data.append("Summary: PC building conversation")
         
-        # Add parts list (not in sentences)
+        # Add parts list (not in sentences) and price if available
         if session.build_result:
-            parts = []
-            lines = session.build_result.split('\n')
-            for line in lines:
-                if ':' in line and any(word in line.lower() for word in ['cpu', 'gpu', 'rtx', 'ssd', 'ram', 'case', 'motherboard', 'power supply']):
-                    part = line.split(':', 1)[1].strip()
-                    # Extract just the component name, not full description
-                    if '(' in part:
-                        part = part.split('(')[0].strip()
-                    parts.append(part)
-            
-            if parts:
-                compressed_data.append(f"Parts: {','.join(parts)}")
-        
-        # Add price if available
-        if session.build_result:
-            lines = session.build_result.split('\n')
-            for line in lines:
-                if 'TOTAL = $' in line:
-                    price = line.split('TOTAL = $')[1].strip()
-                    compressed_data.append(f"Price: ${price}")
-                    break
+            parsed = session.get_parsed_build()
+            if parsed.part_names:
+                compressed_data.append(f"Parts: {','.join(parsed.part_names)}")
+            if parsed.total_price is not None:
+                compressed_data.append(f"Price: ${parsed.total_price}")
         
         # Add user feedback if exists
         if session.user_feedback:
@@ -1057,34 +1675,163 @@ Respond with just the compressed summary, no formatting.
         if session.build_edits:
             compressed_data.append(f"Edits: {','.join(session.build_edits)}")
         
-        # Write to compressed sessions file with file locking
-        sessions_file = os.path.join(SCRIPT_DIR, 'discord_sessions_compressed.txt')
-        with FileLock(SESSIONS_LOCK_FILE):
-            with open(sessions_file, 'a', encoding='utf-8') as f:
-                f.write('\n'.join(compressed_data) + '\n\n')
+        # Appended by the compressed-sessions writer task
+        compressed_sessions_writer.put('\n'.join(compressed_data) + '\n\n')
             
     except Exception as e:
         logger.error(f"Error saving compressed session: {e}")
 
+# Sessions whose compressed record is due, keyed by user; a burst of turns collapses into one record.
+# The session object is kept so a record still goes out if the session is cleared before the flush.
+compressed_dirty: Dict[int, PCBuilderSession] = {}
+
+def mark_compressed_dirty(user_id, session):
+    """Schedule a compressed-session record for the next flush"""
+    compressed_dirty[user_id] = session
+
+async def flush_compressed_sessions():
+    """Write one compressed record per session changed since the last flush"""
+    if not compressed_dirty:
+        return
+    pending = list(compressed_dirty.items())
+    compressed_dirty.clear()
+    # Concurrently, so one slow summary doesn't hold up the rest
+    await asyncio.gather(*(save_session_compressed(user_id, session) for user_id, session in pending))
+
+class PCBuilderBot(commands.Bot):
+    async def setup_hook(self):
+        # Taken once at startup (not on import) instead of around every file write
+        if not acquire_instance_lock():
+            logger.error(f"Another bot instance is already running (lock held on {INSTANCE_LOCK_FILE})")
+            raise SystemExit(1)
+    
+    async def close(self):
+        # Don't drop records still waiting for the debounced flush
+        await flush_compressed_sessions()
+        await super().close()
+
 # Discord Bot Setup
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+bot = PCBuilderBot(command_prefix='!', intents=intents)
+
+# Refinement messages asking for a different build (substring match, so "changing" and "upgrades" count too)
+CHANGE_WORDS_RE = re.compile(
+    r'change|upgrade|downgrade|replace|swap|different|better|cheaper|more|less|instead|rather|prefer'
+)
+
+# One refinement turn (a Gemini call, possibly a full rebuild) per user every few seconds
+REFINEMENT_COOLDOWN = commands.CooldownMapping.from_cooldown(1, 2.0, commands.BucketType.user)
+
+# Embeds sent on every turn are built once; static ones are sent as-is and the
+# rest are copied so only the dynamic description is set per message.
+THINKING_EMBED = discord.Embed(
+    title="🤔 Generating Your Custom PC Build...",
+    description="This may take a moment while I analyze the latest parts and create your perfect build.",
+    color=0xffaa00
+)
+
+CONVERSATION_EMBED = discord.Embed(
+    title="💬 PC Builder Assistant",
+    color=0x00ff00
+)
+CONVERSATION_EMBED.set_footer(text="Type 'cancel' to stop, or 'restart' to begin again")
+
+REFINE_EMBED = discord.Embed(
+    title="💬 Build Assistant",
+    color=0x00ff00
+)
+REFINE_EMBED.set_footer(text="Type 'done' when finished, or 'restart' to start over")
+
+BUILD_ERROR_EMBED = discord.Embed(
+    title="❌ Build Generation Error",
+    color=0xff0000
+)
+
+REFINE_INVITE_EMBED = discord.Embed(
+    title="💬 Want to Refine Your Build?",
+    description="Thanks for the feedback! I'm here if you want to make changes or ask questions! You can:\n\n"
+               "• Ask about specific parts or performance\n"
+               "• Request upgrades or downgrades\n"
+               "• Change colors, RGB, or aesthetics\n"
+               "• Get compatibility advice\n"
+               "• Or just chat about your build!\n\n"
+               "Just type your question or request, and I'll help you out! 🚀",
+    color=0x9932cc
+)
+REFINE_INVITE_EMBED.set_footer(text="Type 'done' when you're happy with your build, or 'restart' to start over")
+
+def _restart_embed(commands_text):
+    embed = discord.Embed(
+        title="🔄 Restarting PC Build",
+        description="Starting fresh! Let's build you an awesome PC from scratch.",
+        color=0xffaa00
+    )
+    embed.add_field(
+        name="What's Next?",
+        value="I'll ask you some questions to understand what you need, then generate your perfect build!",
+        inline=False
+    )
+    embed.add_field(name="📋 Available Commands", value=commands_text, inline=False)
+    embed.set_footer(text="Type 'cancel' at any time to stop")
+    return embed
+
+# Restart typed as a message inside a build thread
+RESTART_EMBED = _restart_embed(
+    "• `!build` - Start building a PC\n"
+    "• `!cancel` - Cancel build session\n"
+    "• `!health` - Check bot status"
+)
+# Restart via the !restart command
+RESTART_COMMAND_EMBED = _restart_embed(
+    "• `!restart` - Start over from beginning\n"
+    "• `!parts` - Show current build parts\n"
+    "• `!status` - Check build progress\n"
+    "• `!cancel` - Cancel build session\n"
+    "• `!health` - Check bot status\n"
+    "• `!collective` - View all builds"
+)
 
 @bot.event
 async def on_ready():
+    global parts_data_available
     logger.info(f'{bot.user} has connected to Discord!')
     
-    # Check if parts data file exists
-    if not os.path.exists(PARTS_DATA_FILE):
+    # Check if parts data file exists (off the event loop)
+    parts_data_available = await asyncio.to_thread(os.path.exists, PARTS_DATA_FILE)
+    if not parts_data_available:
         logger.error(f"CRITICAL: Parts data file not found: {PARTS_DATA_FILE}")
         logger.error("The bot will not function properly without this file!")
     else:
         logger.info(f"Parts data file found: {PARTS_DATA_FILE}")
     
-    cleanup_task.start()
-
-@tasks.loop(hours=6)
+    if not cleanup_task.is_running():
+        cleanup_task.start()
+    if not flush_sessions_task.is_running():
+        flush_sessions_task.start()
+    if not compact_sessions_task.is_running():
+        compact_sessions_task.start()
+    if not flush_compressed_task.is_running():
+        flush_compressed_task.start()
+    collective_writer.start()
+    compressed_sessions_writer.start()
+
+@tasks.loop(seconds=1)
+async def flush_sessions_task():
+    """Append sessions changed since the last tick to the session log"""
+    await session_manager.save_sessions()
+
+@tasks.loop(seconds=0.5)
+async def flush_compressed_task():
+    """Write compressed records for sessions changed since the last tick"""
+    await flush_compressed_sessions()
+
+@tasks.loop(minutes=5)
+async def compact_sessions_task():
+    """Fold the session change log into the snapshot file"""
+    await session_manager.compact_sessions()
+
+@tasks.loop(minutes=5)
 async def cleanup_task():
     """Clean up old sessions periodically"""
     session_manager.cleanup_old_sessions()
@@ -1102,30 +1849,6 @@ async def start_build(ctx):
     # Create a private thread for this build session
     thread_name = f"Start Building PC - {ctx.author.display_name}"
     
-    # Check if user has an active session - if not, allow creating new thread
-    if user_id not in session_manager.sessions:
-        # No active session, safe to create new thread
-        pass
-    else:
-        # Check if there's an active, non-archived thread for this user
-        existing_thread = None
-        for thread in ctx.channel.threads:
-            if (thread.name == thread_name and 
-                not thread.archived and 
-                not thread.locked):
-                # Check if user is still in the thread
-                try:
-                    await thread.fetch_member(ctx.author.id)
-                    existing_thread = thread
-                    break
-                except:
-                    # User not in thread, it's safe to create new one
-                    pass
-        
-        if existing_thread:
-            await ctx.send(f"You already have an active build thread: {existing_thread.mention}")
-            return
-    
     # Create new private thread
     try:
         logger.info(f"Attempting to create private thread: {thread_name}")
@@ -1151,12 +1874,12 @@ async def start_build(ctx):
     session = session_manager.get_session(user_id)
     
     # Reset session to start fresh
-    session.chat_history = []
+    session.chat_history.clear()
     session.answers = {}
     session.conversation_mode = True
     session.refinement_mode = False
     session.build_result = ""
-    await save_session_compressed(ctx.author.id, session)
+    session_manager.mark_dirty(user_id)
     
     # Send the preloaded greeting in the thread
     embed = discord.Embed(
@@ -1183,12 +1906,7 @@ async def generate_and_send_build(ctx, session: PCBuilderSession):
     """Generate and send the PC build"""
     
     # Show generating message
-    thinking_embed = discord.Embed(
-        title="🤔 Generating Your Custom PC Build...",
-        description="This may take a moment while I analyze the latest parts and create your perfect build.",
-        color=0xffaa00
-    )
-    thinking_msg = await ctx.send(embed=thinking_embed)
+    thinking_msg = await ctx.send(embed=THINKING_EMBED)
     
     # Generate the build
     build_result = await build_generator.generate_build(session)
@@ -1199,11 +1917,16 @@ async def generate_and_send_build(ctx, session: PCBuilderSession):
     # Store build result and enter refinement mode
     session.build_result = build_result
     session.refinement_mode = True
-    await save_session_compressed(ctx.author.id, session)
+    session_manager.mark_dirty(session.user_id)
+    mark_compressed_dirty(ctx.author.id, session)
     
     # Parse and send results
     await send_build_result(ctx, session, build_result)
 
+# Discord limits per message: 10 embeds, 6000 characters across all of them
+EMBEDS_PER_MESSAGE = 10
+EMBED_CHARS_PER_MESSAGE = 6000
+
 async def send_build_result(ctx, session: PCBuilderSession, build_result: str):
     """Send the build result in a nice format"""
     
@@ -1211,34 +1934,11 @@ async def send_build_result(ctx, session: PCBuilderSession, build_result: str):
         await ctx.send(build_result)
         return
     
-    # Parse the build result
-    lines = build_result.split('\n')
-    build_name = lines[0] if lines else "Custom PC Build"
-    
-    # Extract description and components
-    description_lines = []
-    component_lines = []
-    in_components = False
-    
-    for line in lines[1:]:
-        line = line.strip()
-        if not line:
-            continue
-        
-        if "COMPONENT BREAKDOWN" in line.upper():
-            in_components = True
-            continue
-        elif "DEBUG PRICE CHECK" in line.upper():
-            break
-        elif "EXTRA NOTES" in line.upper():
-            break
-        
-        if in_components:
-            if line and not line.startswith('---'):
-                component_lines.append(line)
-        else:
-            if line and not line.startswith('#'):
-                description_lines.append(line)
+    # Parse the build result (cached on the session when it's the session's current build)
+    parsed = session.get_parsed_build() if build_result is session.build_result else parse_build(build_result)
+    build_name = parsed.name
+    description_lines = parsed.description_lines
+    component_lines = parsed.component_lines
     
     # Create main embed
     main_embed = discord.Embed(
@@ -1250,9 +1950,11 @@ async def send_build_result(ctx, session: PCBuilderSession, build_result: str):
     
     await ctx.send(embed=main_embed)
     
-    # Send components (without images for now)
+    # Send components (without images for now), packed into as few messages as Discord allows
     if component_lines:
-        for line in component_lines:
+        embeds_batch = []
+        batch_chars = 0
+        for current_idx, line in enumerate(component_lines):
             if ':' in line:
                 # Extract component type and name
                 component_type = line.split(':')[0].strip()
@@ -1267,16 +1969,11 @@ async def send_build_result(ctx, session: PCBuilderSession, build_result: str):
                 
                 # Add next few lines as description if they're not component headers
                 desc_lines = []
-                try:
-                    current_idx = component_lines.index(line)
-                    for i in range(current_idx + 1, min(current_idx + 3, len(component_lines))):
-                        next_line = component_lines[i]
-                        if ':' in next_line and not next_line.startswith(' '):
-                            break  # Next component
-                        if next_line.strip() and not next_line.startswith('---'):
-                            desc_lines.append(next_line.strip())
-                except:
-                    pass
+                for next_line in component_lines[current_idx + 1:current_idx + 3]:
+                    if ':' in next_line and not next_line.startswith(' '):
+                        break  # Next component
+                    if next_line.strip() and not next_line.startswith('---'):
+                        desc_lines.append(next_line.strip())
                 
                 if desc_lines:
                     component_embed.add_field(
@@ -1285,15 +1982,20 @@ async def send_build_result(ctx, session: PCBuilderSession, build_result: str):
                         inline=False
                     )
                 
-                await ctx.send(embed=component_embed)
-                
-                # Small delay to avoid rate limits
-                await asyncio.sleep(0.5)
+                embed_chars = len(component_embed)
+                if len(embeds_batch) == EMBEDS_PER_MESSAGE or batch_chars + embed_chars > EMBED_CHARS_PER_MESSAGE:
+                    await ctx.send(embeds=embeds_batch)
+                    embeds_batch = []
+                    batch_chars = 0
+                embeds_batch.append(component_embed)
+                batch_chars += embed_chars
+        
+        if embeds_batch:
+            await ctx.send(embeds=embeds_batch)
     
     # Send full build as file for easy copying
-    import io
     build_file = discord.File(
-        fp=io.StringIO(build_result),
+        fp=io.BytesIO(build_result.encode('utf-8')),
         filename=f"pc_build_{session.user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
     )
     
@@ -1322,6 +2024,7 @@ async def send_build_result(ctx, session: PCBuilderSession, build_result: str):
     
     # Set feedback mode
     session.feedback_mode = True
+    session_manager.mark_dirty(session.user_id)
 
 @bot.event
 async def on_message(message):
@@ -1349,11 +2052,10 @@ async def on_message(message):
     
     # Check if user has an active session
     user_id = message.author.id
-    if user_id not in session_manager.sessions:
+    session = session_manager.find_session(user_id)
+    if session is None:
         return  # Ignore messages in threads if no active session
     
-    session = session_manager.get_session(user_id)
-    
     # Check for special commands
     if message.content.lower() == 'cancel':
         session_manager.clear_session(user_id)
@@ -1369,26 +2071,7 @@ async def on_message(message):
         new_session.conversation_mode = True
         
         # Send restart message and start conversation
-        restart_embed = discord.Embed(
-            title="🔄 Restarting PC Build",
-            description="Starting fresh! Let's build you an awesome PC from scratch.",
-            color=0xffaa00
-        )
-        restart_embed.add_field(
-            name="What's Next?",
-            value="I'll ask you some questions to understand what you need, then generate your perfect build!",
-            inline=False
-        )
-        restart_embed.add_field(
-            name="📋 Available Commands",
-            value="• `!build` - Start building a PC\n"
-                  "• `!cancel` - Cancel build session\n"
-                  "• `!health` - Check bot status",
-            inline=False
-        )
-        restart_embed.set_footer(text="Type 'cancel' at any time to stop")
-        
-        await message.channel.send(embed=restart_embed)
+        await message.channel.send(embed=RESTART_EMBED)
         
         # Start the conversation
         await handle_conversation_mode(message, new_session)
@@ -1396,28 +2079,17 @@ async def on_message(message):
     
     # Handle feedback mode
     if session.feedback_mode:
+        # Switch modes before anything is awaited so the logged state is never half-way
         session.user_feedback = message.content
         session.feedback_mode = False
+        session.refinement_mode = True
+        session_manager.mark_dirty(user_id)
         
         # Save build to collective file
         await save_build_to_collective_file(session)
         
         # Send refinement invitation
-        refinement_embed = discord.Embed(
-            title="💬 Want to Refine Your Build?",
-            description="Thanks for the feedback! I'm here if you want to make changes or ask questions! You can:\n\n"
-                       "• Ask about specific parts or performance\n"
-                       "• Request upgrades or downgrades\n"
-                       "• Change colors, RGB, or aesthetics\n"
-                       "• Get compatibility advice\n"
-                       "• Or just chat about your build!\n\n"
-                       "Just type your question or request, and I'll help you out! 🚀",
-            color=0x9932cc
-        )
-        refinement_embed.set_footer(text="Type 'done' when you're happy with your build, or 'restart' to start over")
-        
-        await message.channel.send(embed=refinement_embed)
-        session.refinement_mode = True
+        await message.channel.send(embed=REFINE_INVITE_EMBED)
         return
     
     if message.content.lower() == 'done':
@@ -1442,16 +2114,22 @@ async def handle_conversation_mode(message, session: PCBuilderSession):
     """Handle the conversational PC building flow"""
     try:
         # Add user message to chat history
-        session.chat_history.append({'role': 'user', 'text': message.content})
+        session.add_message('user', message.content)
+        session_manager.mark_dirty(session.user_id)
+        
+        # Everything needed is already in the chat - go straight to the build without another Gemini turn
+        if are_all_fields_collected(session):
+            logger.info(f"All fields collected for user {session.user_id}, auto-triggering build generation")
+            await generate_build_from_conversation(message.channel, session)
+            return
         
         # Show typing indicator
         async with message.channel.typing():
             # Build conversation prompt
-            prompt = conversational_flow.build_conversation_prompt(session.chat_history, session.answers)
+            prompt = conversational_flow.build_conversation_prompt(session)
             
             # Get response from Gemini
-            response = build_generator.model.generate_content(prompt, request_options={'timeout': 30})
-            ai_text = getattr(response, 'text', '') or ''
+            ai_text = await build_generator.generate_text(prompt, timeout=30)
             
             if not ai_text:
                 ai_text = "I'm here to help! What would you like to know about building a PC?"
@@ -1462,28 +2140,19 @@ async def handle_conversation_mode(message, session: PCBuilderSession):
                 await generate_build_from_conversation(message.channel, session)
                 return
             
-            # Also check if all required fields are collected (backup detection)
-            if are_all_fields_collected(session):
-                logger.info(f"All fields collected for user {session.user_id}, auto-triggering build generation")
-                await generate_build_from_conversation(message.channel, session)
-                return
-            
             # Add AI response to chat history
-            session.chat_history.append({'role': 'assistant', 'text': ai_text})
+            session.add_message('assistant', ai_text)
             
             # Send response
-            embed = discord.Embed(
-                title="💬 PC Builder Assistant",
-                description=ai_text,
-            color=0x00ff00
-        )
-            embed.set_footer(text="Type 'cancel' to stop, or 'restart' to begin again")
+            embed = CONVERSATION_EMBED.copy()
+            embed.description = ai_text
             
             await message.channel.send(embed=embed)
             
             # Update session activity
             session.update_activity()
-            await save_session_compressed(message.author.id, session)
+            session_manager.mark_dirty(session.user_id)
+            mark_compressed_dirty(message.author.id, session)
             
     except Exception as e:
         logger.error(f"Error in conversation mode: {e}")
@@ -1493,12 +2162,7 @@ async def generate_build_from_conversation(channel, session: PCBuilderSession):
     """Generate build from conversational answers"""
     try:
         # Show generating message
-        thinking_embed = discord.Embed(
-            title="🤔 Generating Your Custom PC Build...",
-            description="This may take a moment while I analyze the latest parts and create your perfect build.",
-            color=0xffaa00
-        )
-        thinking_msg = await channel.send(embed=thinking_embed)
+        thinking_msg = await channel.send(embed=THINKING_EMBED)
         
         # Generate the build using the answers from conversation
         build_result = await build_generator.generate_build(session)
@@ -1510,25 +2174,30 @@ async def generate_build_from_conversation(channel, session: PCBuilderSession):
         session.build_result = build_result
         session.refinement_mode = True
         session.conversation_mode = False
-        await save_session_compressed(session.user_id, session)
+        session_manager.mark_dirty(session.user_id)
+        mark_compressed_dirty(session.user_id, session)
         
         # Parse and send results
         await send_build_result(channel, session, build_result)
         
     except Exception as e:
         logger.error(f"Error generating build from conversation: {e}")
-        error_embed = discord.Embed(
-            title="❌ Build Generation Error",
-            description=f"Sorry, I ran into an issue generating your build: `{str(e)[:100]}`\n\nPlease try again or contact support if the issue persists.",
-            color=0xff0000
-        )
+        error_embed = BUILD_ERROR_EMBED.copy()
+        error_embed.description = f"Sorry, I ran into an issue generating your build: `{str(e)[:100]}`\n\nPlease try again or contact support if the issue persists."
         await channel.send(embed=error_embed)
 
 async def handle_refinement_conversation(message, session: PCBuilderSession):
     """Handle refinement conversation after build is complete"""
+    retry_after = REFINEMENT_COOLDOWN.get_bucket(message).update_rate_limit()
+    if retry_after:
+        await message.channel.send(f"⏳ Slow down a little - try again in {retry_after:.1f}s.")
+        return
+    
     try:
+        content_lower = message.content.lower()
+        
         # Track what the user said for build edits
-        if message.content.lower() not in ['done', 'restart', 'cancel']:
+        if content_lower not in ('done', 'restart', 'cancel'):
             session.build_edits.append(message.content)
         
         # Show typing indicator
@@ -1539,28 +2208,31 @@ async def handle_refinement_conversation(message, session: PCBuilderSession):
             )
             
             # Check if the response indicates changes were made (look for keywords)
-            user_message = message.content.lower()
-            made_changes = any(word in user_message for word in [
-                'change', 'upgrade', 'downgrade', 'replace', 'swap', 'different', 
-                'better', 'cheaper', 'more', 'less', 'instead', 'rather', 'prefer'
-            ])
+            made_changes = CHANGE_WORDS_RE.search(content_lower) is not None
+            refinement_lower = refinement_response.lower()
             
             # Send response
-            embed = discord.Embed(
-                title="💬 Build Assistant",
-                description=refinement_response,
-                color=0x00ff00
-            )
-            embed.set_footer(text="Type 'done' when finished, or 'restart' to start over")
+            embed = REFINE_EMBED.copy()
+            embed.description = refinement_response
             
             await message.channel.send(embed=embed)
             
             # If changes were requested, regenerate and show updated build
-            if made_changes and 'change' in refinement_response.lower():
-                await message.channel.send("🔄 **Regenerating your build with the requested changes...**")
+            if made_changes and 'change' in refinement_lower:
+                # Post the notice while Gemini works rather than before it starts
+                notice_task = asyncio.create_task(
+                    message.channel.send("🔄 **Regenerating your build with the requested changes...**")
+                )
                 
-                # Generate new build with updated parameters
-                new_build_result = await build_generator.generate_build(session)
+                # Generate new build with updated parameters (a fresh roll, not the cached build)
+                new_build_result = await build_generator.generate_build(session, use_cache=False)
+                
+                # The notice has to be in the channel before the new build is; a failed notice
+                # mustn't throw away the build that was just generated
+                try:
+                    await notice_task
+                except discord.HTTPException as e:
+                    logger.warning(f"Could not send regenerating notice: {e}")
                 
                 # Update session with new build
                 session.build_result = new_build_result
@@ -1570,7 +2242,8 @@ async def handle_refinement_conversation(message, session: PCBuilderSession):
             
             # Update session activity
             session.update_activity()
-            await save_session_compressed(message.author.id, session)
+            session_manager.mark_dirty(session.user_id)
+            mark_compressed_dirty(message.author.id, session)
             
     except Exception as e:
         logger.error(f"Error in refinement conversation: {e}")
@@ -1603,29 +2276,7 @@ async def restart_build(ctx):
     session.conversation_mode = True
     
     # Send restart message
-    restart_embed = discord.Embed(
-        title="🔄 Restarting PC Build",
-        description="Starting fresh! Let's build you an awesome PC from scratch.",
-        color=0xffaa00
-    )
-    restart_embed.add_field(
-        name="What's Next?",
-        value="I'll ask you some questions to understand what you need, then generate your perfect build!",
-        inline=False
-    )
-    restart_embed.add_field(
-        name="📋 Available Commands",
-        value="• `!restart` - Start over from beginning\n"
-              "• `!parts` - Show current build parts\n"
-              "• `!status` - Check build progress\n"
-              "• `!cancel` - Cancel build session\n"
-              "• `!health` - Check bot status\n"
-              "• `!collective` - View all builds",
-        inline=False
-    )
-    restart_embed.set_footer(text="Type 'cancel' at any time to stop")
-    
-    await ctx.send(embed=restart_embed)
+    await ctx.send(embed=RESTART_COMMAND_EMBED)
     
     # Start the conversation
     await handle_conversation_mode(ctx, session)
@@ -1634,6 +2285,14 @@ async def restart_build(ctx):
 
 # Removed !status command - users don't need this
 
+# Seconds an existence check for an optional data file is reused
+EXISTS_CACHE_TTL = 10
+
+@lru_cache(maxsize=4)
+def _exists_cached(path, _bucket):
+    """os.path.exists, memoized per path for one EXISTS_CACHE_TTL bucket"""
+    return os.path.exists(path)
+
 @bot.command(name='health', help='Check bot health and dependencies', case_insensitive=True)
 async def health_check(ctx):
     """Check bot health and dependencies"""
@@ -1643,18 +2302,25 @@ async def health_check(ctx):
     )
     
     # Check parts data file
-    parts_status = "✅ Found" if os.path.exists(PARTS_DATA_FILE) else "❌ Missing"
+    parts_status = "✅ Found" if parts_data_available else "❌ Missing"
     embed.add_field(name="Parts Data File", value=f"{parts_status}\n`{PARTS_DATA_FILE}`", inline=False)
     
     # Check image cache
-    image_status = "✅ Found" if os.path.exists(IMAGE_CACHE_FILE) else "⚠️ Optional (not found)"
+    image_found = _exists_cached(IMAGE_CACHE_FILE, int(time.time()) // EXISTS_CACHE_TTL)
+    image_status = "✅ Found" if image_found else "⚠️ Optional (not found)"
     embed.add_field(name="Image Cache", value=image_status, inline=True)
     
     # Check API connection (basic test)
     try:
-        # Quick test of Gemini API
-        test_response = build_generator.model.generate_content("Test", request_options={'timeout': 5})
+        # Quick test of Gemini API, in a worker thread with a hard cap so the bot keeps responding.
+        # Calls the model directly, off the Gemini pool: queueing behind busy builds would read as an API failure
+        await asyncio.wait_for(
+            asyncio.to_thread(build_generator.model.generate_content, "Test", request_options={'timeout': 5}),
+            timeout=5
+        )
         api_status = "✅ Connected"
+    except asyncio.TimeoutError:
+        api_status = "❌ Error: timed out after 5s"
     except Exception as e:
         api_status = f"❌ Error: {str(e)[:50]}..."
     embed.add_field(name="Gemini API", value=api_status, inline=True)
@@ -1691,7 +2357,7 @@ if __name__ == "__main__":
     print(f"🚀 Bot Instance ID: {INSTANCE_ID}")
     print("⚠️  IMPORTANT: Discord bots cannot run multiple instances with the same token!")
     print("   Each bot instance needs its own unique Discord token.")
-    print("   File locking is implemented to prevent conflicts if multiple instances somehow run.")
+    print("   A startup lock file stops a second instance from running against the same data files.")
     print()
     
     try:
@@ -4,10 +4,10 @@ Main entry point for Discord PC Build Bot on Google Cloud Platform
 """
 
 import os
+import json
 import logging
 import asyncio
-from flask import Flask, request, jsonify
-import threading
+from aiohttp import web
 import time
 
 # Configure logging for Google Cloud
@@ -19,87 +19,99 @@ logger = logging.getLogger(__name__)
 
 # Import the Discord bot
 try:
-    from discord_pc_bot import bot, TOKEN
+    from discord_pc_bot import bot, BOT_TOKEN
 except ImportError as e:
     logger.error(f"Failed to import Discord bot: {e}")
     raise
 
-# Flask app for health checks
-app = Flask(__name__)
-
-@app.route('/health', methods=['GET'])
-def health_check():
+async def health_check(request):
     """Health check endpoint for Google Cloud"""
     try:
         # Check if bot is running
         if bot.is_ready():
-            return jsonify({
+            return web.json_response({
                 'status': 'healthy',
                 'bot_ready': True,
                 'timestamp': time.time()
-            }), 200
+            }, status=200)
         else:
-            return jsonify({
+            return web.json_response({
                 'status': 'starting',
                 'bot_ready': False,
                 'timestamp': time.time()
-            }), 202
+            }, status=202)
     except Exception as e:
         logger.error(f"Health check failed: {e}")
-        return jsonify({
+        return web.json_response({
             'status': 'unhealthy',
             'error': str(e),
             'timestamp': time.time()
-        }), 500
+        }, status=500)
+
+# The root payload never changes, so it is encoded once
+ROOT_BODY = json.dumps({
+    'service': 'Discord PC Build Bot',
+    'status': 'running',
+    'version': '1.0.0'
+}).encode('utf-8')
 
-@app.route('/', methods=['GET'])
-def root():
+async def root(request):
     """Root endpoint"""
-    return jsonify({
-        'service': 'Discord PC Build Bot',
-        'status': 'running',
-        'version': '1.0.0'
-    }), 200
+    return web.Response(body=ROOT_BODY, status=200, content_type='application/json')
 
-def run_discord_bot():
-    """Run the Discord bot in a separate thread"""
+def create_app():
+    """aiohttp app serving the health endpoints"""
+    app = web.Application()
+    app.router.add_get('/health', health_check)
+    app.router.add_get('/', root)
+    return app
+
+async def run_discord_bot():
+    """Run the Discord bot on the current event loop"""
     try:
         logger.info("Starting Discord bot...")
         
         # Get token from environment variable
-        bot_token = os.environ.get('DISCORD_BOT_TOKEN') or TOKEN
+        bot_token = os.environ.get('DISCORD_BOT_TOKEN') or BOT_TOKEN
         
         if not bot_token:
             logger.error("No Discord bot token found in environment variables")
             return
         
         # Run the bot
-        bot.run(bot_token)
+        async with bot:
+            await bot.start(bot_token)
         
     except Exception as e:
         logger.error(f"Discord bot failed to start: {e}")
 
+async def serve():
+    """Serve the health endpoints and run the bot on one event loop"""
+    port = int(os.environ.get('PORT', 8080))
+    runner = web.AppRunner(create_app())
+    await runner.setup()
+    site = web.TCPSite(runner, host='0.0.0.0', port=port)
+    
+    try:
+        # Health endpoints are up before the bot starts connecting
+        await site.start()
+        logger.info(f"Health endpoints listening on port {port}")
+        
+        await run_discord_bot()
+        
+        # Keep answering health checks (as "starting") if the bot couldn't run
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+
 def main():
-    """Main function to start both Flask and Discord bot"""
+    """Main function to start both the health server and Discord bot"""
     logger.info("Starting Discord PC Build Bot service...")
     
-    # Start Discord bot in a separate thread
-    discord_thread = threading.Thread(target=run_discord_bot, daemon=True)
-    discord_thread.start()
-    
-    # Wait a moment for bot to initialize
-    time.sleep(2)
-    
-    # Start Flask app for health checks
-    port = int(os.environ.get('PORT', 8080))
-    logger.info(f"Starting Flask app on port {port}")
-    
-    app.run(
-        host='0.0.0.0',
-        port=port,
-        debug=False,
-        threaded=True
-    )
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        logger.info("Shutting down...")
 
 if __name__ == '__main__':
     main()
@@ -8,8 +8,7 @@ import logging
 import asyncio
 import discord
 from discord.ext import commands
-import threading
-import time
+import signal
 
 # Configure logging for Google Cloud
 logging.basicConfig(
@@ -43,8 +42,8 @@ async def health_check(ctx):
     embed.add_field(name="Latency", value=f"{round(bot.latency * 1000)}ms", inline=True)
     await ctx.send(embed=embed)
 
-def run_bot():
-    """Run the Discord bot"""
+async def run_bot():
+    """Run the Discord bot until it disconnects or the process is asked to stop"""
     try:
         logger.info("Starting Discord bot...")
         
@@ -55,8 +54,17 @@ def run_bot():
             logger.error("No Discord bot token found in environment variables")
             return
         
+        # Close the bot cleanly on Ctrl+C / container stop
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, lambda: asyncio.create_task(bot.close()))
+            except NotImplementedError:
+                pass  # Windows event loops don't support signal handlers; Ctrl+C still raises KeyboardInterrupt
+        
         # Run the bot
-        bot.run(bot_token)
+        async with bot:
+            await bot.start(bot_token)
         
     except Exception as e:
         logger.error(f"Discord bot failed to start: {e}")
@@ -65,16 +73,11 @@ def main():
     """Main function to start the bot"""
     logger.info("Starting Discord PC Build Bot service...")
     
-    # Start Discord bot in a separate thread
-    discord_thread = threading.Thread(target=run_bot, daemon=True)
-    discord_thread.start()
-    
-    # Keep the main thread alive
     try:
-        while True:
-            time.sleep(60)
+        asyncio.run(run_bot())
     except KeyboardInterrupt:
-        logger.info("Shutting down...")
+        pass
+    logger.info("Shutting down...")
 
 if __name__ == '__main__':
     main()
@@ -9,12 +9,13 @@ import sys
 import yaml
 import re
 
+# Discord bot tokens are typically 24 characters for client ID + 27 characters for secret
+# Format: XXXXXXXXXXXXXXXX.XXXXXXXXX.XXXXXXXXXXXXXXXXXXXXXXXXXXX
+_TOKEN_RE = re.compile(r'^[A-Za-z0-9]{24}\.[A-Za-z0-9]{6,7}\.[A-Za-z0-9_-]{27}$')
+
 def validate_token_format(token):
     """Validate Discord bot token format"""
-    # Discord bot tokens are typically 24 characters for client ID + 27 characters for secret
-    # Format: XXXXXXXXXXXXXXXX.XXXXXXXXX.XXXXXXXXXXXXXXXXXXXXXXXXXXX
-    pattern = r'^[A-Za-z0-9]{24}\.[A-Za-z0-9]{6,7}\.[A-Za-z0-9_-]{27}$'
-    return bool(re.match(pattern, token))
+    return _TOKEN_RE.match(token) is not None
 
 def validate_api_key(api_key):
     """Validate Google API key format"""
@@ -56,14 +57,20 @@ def setup_environment():
     print("3. Run: ./deploy.sh (Linux/Mac) or deploy.bat (Windows)")
     print("4. Set environment variables in Google Cloud Console")
 
+# Both app.yaml placeholders, filled in one pass
+_APP_YAML_PLACEHOLDER_RE = re.compile('YOUR_DISCORD_BOT_TOKEN_HERE|YOUR_GEMINI_API_KEY_HERE')
+
 def update_app_yaml(discord_token, gemini_key):
     """Update app.yaml with provided tokens"""
     try:
         with open('app.yaml', 'r') as f:
             content = f.read()
         
-        content = content.replace('YOUR_DISCORD_BOT_TOKEN_HERE', discord_token)
-        content = content.replace('YOUR_GEMINI_API_KEY_HERE', gemini_key)
+        values = {
+            'YOUR_DISCORD_BOT_TOKEN_HERE': discord_token,
+            'YOUR_GEMINI_API_KEY_HERE': gemini_key,
+        }
+        content = _APP_YAML_PLACEHOLDER_RE.sub(lambda m: values[m.group(0)], content)
         
         with open('app.yaml', 'w') as f:
             f.write(content)